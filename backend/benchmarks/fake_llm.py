@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+RECORDED_RESPONSES = os.path.join(os.path.dirname(__file__), 'recorded_responses.json')
+
+with open(RECORDED_RESPONSES) as f:
+    SCENARIOS = json.load(f)['scenarios']
+
+# Sub-query -> recorded pandas query, across all scenarios
+PLANS = {item['sub_query']: item['query'] for scenario in SCENARIOS for item in scenario['sub_queries']}
+
+def find_scenario(question: str) -> dict:
+    # Benchmark questions may carry a suffix to defeat the answer cache
+    for scenario in SCENARIOS:
+        if question.startswith(scenario['question']):
+            return scenario
+    return SCENARIOS[0]
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    return sum(len(str(message.content)) for message in messages) // 4 + 1
+
+def usage(messages: List[BaseMessage], output_tokens: int) -> dict:
+    input_tokens = estimate_tokens(messages)
+    return {'input_tokens': input_tokens, 'output_tokens': output_tokens, 'total_tokens': input_tokens + output_tokens}
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ChatOpenAI that replays recorded Supervisor and Schema Query responses.
+
+    The Supervisor (structured output) delegates the recorded sub-queries, asks for execution once
+    queries were constructed and finishes with the execution result. The Schema Query agent makes
+    one `get_dataset_indexing_structure` tool call and then returns the recorded query.
+    Every call sleeps `latency_ms` to stand in for the network round trip. Streaming calls
+    (as made under /query/stream) yield the recorded message as a single chunk.
+    """
+    model: str = 'fake'
+    temperature: float = 0.0
+    max_retries: int = 0
+    latency_ms: float = float(os.getenv('FAKE_LLM_LATENCY_MS', '50'))
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-replay'
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def schema_agent_message(self, messages: List[BaseMessage]) -> AIMessage:
+        sub_query = next((message.content for message in messages if message.type == 'human' and message.name == 'Supervisor'), '')
+        dataset = 'df2' if 'df2' in sub_query else 'df1'
+        if not any(message.type == 'tool' for message in messages):
+            return AIMessage(
+                content='',
+                tool_calls=[{'name': 'get_dataset_indexing_structure', 'args': {'data': dataset}, 'id': f'call_{abs(hash(sub_query))}'}],
+                usage_metadata=usage(messages, 20),
+            )
+        query = PLANS.get(sub_query, f"{dataset}.iloc[0, 0]")
+        return AIMessage(content=json.dumps({'final_query': query}), usage_metadata=usage(messages, 30))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self.schema_agent_message(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def as_chunk(self, message: AIMessage) -> ChatGenerationChunk:
+        tool_call_chunks = [
+            {'name': call['name'], 'args': json.dumps(call['args']), 'id': call['id'], 'index': index}
+            for index, call in enumerate(message.tool_calls)
+        ]
+        return ChatGenerationChunk(message=AIMessageChunk(content=message.content, tool_call_chunks=tool_call_chunks, usage_metadata=message.usage_metadata))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        yield self.as_chunk(self.schema_agent_message(messages))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        chunk = self.as_chunk(self.schema_agent_message(messages))
+        if run_manager:
+            await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+        yield chunk
+
+    def supervisor_response(self, schema, messages: List[BaseMessage]):
+        turn_start = max((i for i, message in enumerate(messages) if message.type == 'human' and not message.name), default=0)
+        question = messages[turn_start].content
+        turn = messages[turn_start:]
+        executed = [message.content for message in turn if message.name == 'EXECUTE_QUERY']
+
+        if executed:
+            scenario = find_scenario(question)
+            return schema(
+                next_action='FINISH',
+                sub_queries=[],
+                final_response={
+                    'original_user_query': question,
+                    'constructed_pandas_query': '; '.join(item['query'] for item in scenario['sub_queries']),
+                    'output': ' '.join(executed),
+                },
+            )
+        return schema(next_action='Schema_Query_Agent', sub_queries=[item['sub_query'] for item in find_scenario(question)['sub_queries']])
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs):
+        async def respond(prompt):
+            messages = prompt.to_messages()
+            await asyncio.sleep(self.latency_ms / 1000)
+            parsed = self.supervisor_response(schema, messages)
+            if not include_raw:
+                return parsed
+            raw = AIMessage(content='', usage_metadata=usage(messages, 60))
+            return {'raw': raw, 'parsed': parsed, 'parsing_error': None}
+
+        return RunnableLambda(lambda prompt: asyncio.run(respond(prompt)), afunc=respond)
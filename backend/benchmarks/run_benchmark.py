@@ -0,0 +1,224 @@
+"""
+Offline load benchmark for the DataSense API.
+
+Runs the real FastAPI app in-process against synthetic datasets, a replaying fake LLM and,
+when fakeredis is installed, an in-memory Redis; no OpenAI key, S3 bucket or Redis server needed.
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.run_benchmark --requests 200 --concurrency 20
+    python -m benchmarks.run_benchmark --unique-queries --llm-latency-ms 300   # cold graph runs
+    python -m benchmarks.run_benchmark --url http://localhost:8000             # a running server
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Optional
+
+import httpx
+
+from benchmarks.synthetic_data import write_datasets
+
+ENDPOINTS = ['query', 'stream', 'datasets', 'insights']
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help='Requests per endpoint.')
+    parser.add_argument('--concurrency', type=int, default=10, help='Concurrent clients.')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated subset of: ' + ', '.join(ENDPOINTS))
+    parser.add_argument('--unique-queries', action='store_true', help='Make every question unique so the answer cache never hits.')
+    parser.add_argument('--llm-latency-ms', type=float, default=50, help='Simulated latency of every fake LLM call.')
+    parser.add_argument('--workers', type=int, default=2, help='Query execution pool workers (0 runs queries in a thread).')
+    parser.add_argument('--rows', type=int, default=20, help='Row groups per synthetic dataset (x segments x 2 value types).')
+    parser.add_argument('--segments', type=int, default=10, help='Segments per row group.')
+    parser.add_argument('--questions', type=int, default=30, help='Questions per synthetic dataset.')
+    parser.add_argument('--answers', type=int, default=5, help='Answers per question.')
+    parser.add_argument('--url', default=None, help='Benchmark a running server instead of the in-process app.')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+    return parser.parse_args(argv)
+
+def configure_environment(args, data_dir: str):
+    """
+    Points the app at local synthetic data, the fake LLM and (if available) an in-memory Redis.
+    Must run before src.main is imported, since it reads its settings at import time.
+    """
+    keys = write_datasets(data_dir, args.rows, args.segments, args.questions, args.answers)
+    os.environ.update({
+        'DATASET_BACKEND': 'local',
+        'DATASET_ROOT': data_dir,
+        'DF1_KEY': keys['df1'],
+        'DF2_KEY': keys['df2'],
+        'DATASET_CACHE_DIR': os.path.join(data_dir, 'cache'),
+        'EXECUTION_POOL_WORKERS': str(args.workers),
+        'ANSWER_CACHE_SEMANTIC': 'false',
+        'FAKE_LLM_LATENCY_MS': str(args.llm_latency_ms),
+        'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'benchmark'),
+    })
+    for name, default in (('REDIS_HOST', 'localhost'), ('REDIS_PORT', '6379'), ('REDIS_DB', '0')):
+        os.environ.setdefault(name, default)
+
+    import langchain_openai
+    from benchmarks.fake_llm import FakeChatModel
+    langchain_openai.ChatOpenAI = FakeChatModel
+
+    try:
+        import fakeredis.aioredis
+    except ImportError:
+        print('fakeredis is not installed; using the Redis server at REDIS_HOST:REDIS_PORT', file=sys.stderr)
+        return
+
+    import redis.asyncio
+    shared = fakeredis.aioredis.FakeRedis()
+    redis.asyncio.Redis = lambda *args, **kwargs: shared
+
+async def start_app():
+    from src.main import app
+    for handler in app.router.on_startup:
+        await handler()
+    return app
+
+async def stop_app(app):
+    # Wait for the execution workers to exit so they are reaped and counted in RUSAGE_CHILDREN
+    from src.main import query_executor
+    await asyncio.to_thread(query_executor.shutdown, True)
+    for handler in app.router.on_shutdown:
+        await handler()
+
+def question_for(scenarios: list, i: int, unique: bool) -> str:
+    question = scenarios[i % len(scenarios)]['question']
+    # The fake LLM matches recorded scenarios by prefix, so the suffix keeps replies intact
+    return f"{question} (run {i})" if unique else question
+
+def final_event(body: str):
+    """
+    Returns the data of the last `final` or `error` server-sent event as (event, data), or (None, None).
+    """
+    event, last = None, (None, None)
+    for line in body.splitlines():
+        if line.startswith('event: '):
+            event = line[len('event: '):]
+        elif line.startswith('data: ') and event in ('final', 'error'):
+            last = event, json.loads(line[len('data: '):])
+    return last
+
+async def run_load(client: httpx.AsyncClient, endpoint: str, args, scenarios: list) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, statuses, served_by = [], Counter(), Counter()
+
+    async def one(i: int):
+        headers = {'Authorization': f'Bearer bench-{i % args.concurrency}'}
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if endpoint == 'query':
+                    response = await client.post('/query', json={'query': question_for(scenarios, i, args.unique_queries)}, headers=headers)
+                elif endpoint == 'stream':
+                    # Latency covers the whole stream, up to the final event. Questions are numbered
+                    # after the query run's, so unique questions stay unique across both endpoints
+                    response = await client.post('/query/stream', json={'query': question_for(scenarios, args.requests + i, args.unique_queries)}, headers=headers)
+                elif endpoint == 'datasets':
+                    response = await client.get(f"/datasets/df{i % 2 + 1}", params={'offset': (i * 100) % 400, 'limit': 500})
+                else:
+                    response = await client.get('/insights', params={'limit': 20}, headers=headers)
+                status = response.status_code
+                payload = None
+                if status == 200 and endpoint == 'query':
+                    payload = response.json()
+                elif status == 200 and endpoint == 'stream':
+                    # A stream always answers 200; failures arrive as an error event
+                    event, payload = final_event(response.text)
+                    if event != 'final':
+                        status = payload.get('status', 'no_final_event') if payload else 'no_final_event'
+            except httpx.HTTPError as e:
+                status, payload = type(e).__name__, None
+            latencies.append(time.perf_counter() - started)
+        statuses[status] += 1
+        if endpoint in ('query', 'stream') and payload is not None and status == 200:
+            served_by[payload.get('served_by', 'unknown')] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    return summarize(endpoint, latencies, statuses, served_by, elapsed)
+
+def percentile(values: list, q: float) -> Optional[float]:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[int(q) - 1]
+
+def rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+def summarize(endpoint: str, latencies: list, statuses: Counter, served_by: Counter, elapsed: float) -> dict:
+    ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        'endpoint': endpoint,
+        'requests': len(ms),
+        'rps': round(len(ms) / elapsed, 1) if elapsed else None,
+        'p50_ms': rounded(percentile(ms, 50)),
+        'p95_ms': rounded(percentile(ms, 95)),
+        'p99_ms': rounded(percentile(ms, 99)),
+        'errors': sum(count for status, count in statuses.items() if status != 200),
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'served_by': dict(served_by),
+    }
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in kilobytes on Linux; children covers the query execution pool once its workers are reaped
+    return {
+        'api_process': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'largest_child': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+def print_report(report: dict):
+    print(f"{'endpoint':<10} {'requests':>8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  served_by")
+    for row in report['endpoints']:
+        print(f"{row['endpoint']:<10} {row['requests']:>8} {row['rps']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['errors']:>7}  {row['served_by'] or ''}")
+    rss = report.get('peak_rss_mb')
+    if rss is None:
+        return
+    print(f"peak RSS: API process {rss['api_process']} MB, largest execution worker {rss['largest_child']} MB")
+
+async def main(argv=None):
+    args = parse_args(argv)
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(',') if endpoint.strip()]
+
+    with tempfile.TemporaryDirectory(prefix='datasense-bench-') as data_dir:
+        app = None
+        if args.url:
+            transport, base_url = None, args.url
+        else:
+            configure_environment(args, data_dir)
+            app = await start_app()
+            transport, base_url = httpx.ASGITransport(app=app), 'http://benchmark'
+
+        from benchmarks.fake_llm import SCENARIOS
+        report = {'config': {key: value for key, value in vars(args).items() if key != 'json'}, 'endpoints': []}
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120) as client:
+                # Queries run first so the insight history has something to page through
+                for endpoint in endpoints:
+                    report['endpoints'].append(await run_load(client, endpoint, args, SCENARIOS))
+        finally:
+            if app is not None:
+                await stop_app(app)
+
+    if not args.url:
+        # Only meaningful for the in-process app; a running server's memory is not visible here
+        report['peak_rss_mb'] = peak_rss_mb()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+VALUE_TYPES = ['Count', 'Percentage']
+
+def make_dataset(row_groups: int, segments: int, questions: int, answers: int, seed: int) -> pd.DataFrame:
+    """
+    Builds a survey-shaped dataset with the same 3-level row / 2-level column MultiIndex as df1/df2.
+
+    Labels are deterministic ('Row Group 1' / 'Segment 2' / 'Percentage' x 'Question 3' / 'Answer 1'),
+    so recorded pandas queries stay valid for any size.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product(
+        [[f'Row Group {i}' for i in range(1, row_groups + 1)], [f'Segment {j}' for j in range(1, segments + 1)], VALUE_TYPES],
+        names=['Row Main-Category', 'Row Sub-Category', 'Value Type'],
+    )
+    columns = pd.MultiIndex.from_product(
+        [[f'Question {k}' for k in range(1, questions + 1)], [f'Answer {m}' for m in range(1, answers + 1)]],
+        names=['Column Main-Category', 'Column Sub-Category'],
+    )
+    values = rng.integers(0, 1000, size=(len(index), len(columns))).astype(np.float64)
+    # Percentage rows hold shares of the matching count rows
+    values[1::2] = np.round(values[0::2] / values[0::2].sum(axis=1, keepdims=True) * 100, 2)
+    return pd.DataFrame(values, index=index, columns=columns)
+
+def write_datasets(directory: str, row_groups: int, segments: int, questions: int, answers: int) -> dict:
+    """
+    Writes synthetic df1/df2 as pickles the local dataset backend can load; returns their keys.
+    """
+    os.makedirs(directory, exist_ok=True)
+    keys = {}
+    for seed, name in enumerate(['df1', 'df2'], start=1):
+        key = f'{name}.pkl'
+        make_dataset(row_groups, segments, questions, answers, seed).to_pickle(os.path.join(directory, key))
+        keys[name] = key
+    return keys
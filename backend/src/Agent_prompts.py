@@ -58,3 +58,14 @@ def get_supervisor_prompt() -> str:
    Begin your analysis of the user's query.
    """
    return supervisor_prompt
+
+# Registered datasets beyond df1/df2, appended to both prompts
+def get_extra_datasets_prompt(titles: dict) -> str:
+   if not titles:
+      return ""
+   datasets = "\n".join(f'      - "{title}" (mapped to \'{name}\')' for name, title in titles.items())
+   extra_datasets_prompt = f"""
+   Additional datasets, with the same 3-level row index and 2-level column index:
+{datasets}
+   """
+   return extra_datasets_prompt
@@ -1,23 +1,77 @@
-import pandas as pd
-from io import StringIO, BytesIO
 from langchain.agents import tool
-import boto3
-import os
-
-s3 = boto3.client('s3')
-bucket_name = 'ai-powered-dataset-analyzer'
-
-def load_dataset_from_s3(file_key):
-    obj = s3.get_object(Bucket=bucket_name, Key=file_key)
-    data=obj['Body'].read()
-    df = pd.read_excel(BytesIO(data), header=[0,1], index_col=[0,1,2]).fillna(0)
-    df.index.names = ['Row Main-Category', 'Row Sub-Category', 'Value Type']
-    df.columns.names = ['Column Main-Category', 'Column Sub-Category']
+from src.Dataset_store import DatasetStore, DATASET_SOURCES, create_backend
+import json
+
+# Datasets are loaded lazily on first use from the local columnar cache
+dataset_store = DatasetStore(create_backend(), DATASET_SOURCES)
+
+def build_schema_catalog(name, df):
+    """
+    Precomputes everything the schema tools report about a dataset.
+
+    Built once per load so the agent loop serves level values, dtypes and info
+    from memory instead of re-introspecting the DataFrame on every tool call.
+    """
+    row_index_values = {
+        level: df.index.get_level_values(i).unique().tolist()
+        for i, level in enumerate(df.index.names)
+    }
+    column_index_values = {
+        level: df.columns.get_level_values(i).unique().tolist()
+        for i, level in enumerate(df.columns.names)
+    }
+    index_info = {
+        'dataset': name,
+        'shape': list(df.shape),
+        'row_index_levels': list(df.index.names),
+        'row_index_values': row_index_values,
+        'column_index_levels': list(df.columns.names),
+        'column_index_values': column_index_values,
+    }
+
+    dtype_counts = df.dtypes.astype(str).value_counts().to_dict()
+    dtypes = ", ".join(f"{dtype}({count})" for dtype, count in dtype_counts.items())
+    memory_kb = df.memory_usage(deep=True).sum() / 1024
+
+    return {
+        'indexing_structure': json.dumps(index_info, separators=(',', ':'), ensure_ascii=False),
+        'info': (
+            f"Dataset {name}: {df.shape[0]} rows x {df.shape[1]} columns; "
+            f"row index {list(df.index.names)}; column index {list(df.columns.names)}; "
+            f"dtypes {dtypes}; non-null {int(df.notna().sum().sum())}/{df.size}; memory {memory_kb:.1f} KB"
+        ),
+    }
+
+# Schema catalogs keyed by dataset name, holding (version, catalog)
+schema_catalog = {}
+
+def get_dataset(name):
+    df, _ = dataset_store.get(name)
     return df
 
-# Load datasets
-df1 = load_dataset_from_s3('data/Dataset1.xlsx')
-df2 = load_dataset_from_s3('data/Dataset2.xlsx')
+def get_dataset_versions():
+    """
+    Returns the versions of all datasets, used to scope cached answers and queries.
+    """
+    return {name: dataset_store.get(name)[1] for name in dataset_store.sources}
+
+def get_dataset_version():
+    return "-".join(get_dataset_versions().values())
+
+def get_schema_catalog(name):
+    df, version = dataset_store.get(name)
+    cached = schema_catalog.get(name)
+    # Only rebuilt when the dataset has been reloaded with a new version
+    if cached is None or cached[0] != version:
+        cached = (version, build_schema_catalog(name, df))
+        schema_catalog[name] = cached
+    return cached[1]
+
+def forget_schema_catalog(name):
+    schema_catalog.pop(name, None)
+
+def unknown_dataset(data):
+    return f"Error: Unknown dataset '{data}'. Available datasets: {', '.join(dataset_store.sources)}."
 
 @tool
 def get_dataset_indexing_structure(data: str) -> str:
@@ -25,7 +79,7 @@ def get_dataset_indexing_structure(data: str) -> str:
     Provides a structured representation of the dataset's indexing structure in JSON format.
 
     Parameters:
-    data (str): The name of the dataset to analyze ('df1' or 'df2').
+    data (str): The name of the dataset to analyze (e.g. 'df1' or 'df2').
 
     Returns:
     str: A JSON string containing:
@@ -34,54 +88,32 @@ def get_dataset_indexing_structure(data: str) -> str:
         - 'column_index_levels': List of column index level names.
         - 'column_index_values': Dictionary mapping each column index level to its unique values.
     """
-    import json
-    df = df1 if data == 'df1' else df2
-
-    row_index_levels = df.index.names
-    row_index_values = {
-        name: df.index.get_level_values(i).unique().tolist()
-        for i, name in enumerate(df.index.names)
-    }
-
-    column_index_levels = df.columns.names
-    column_index_values = {
-        name: df.columns.get_level_values(i).unique().tolist()
-        for i, name in enumerate(df.columns.names)
-    }
-
-    index_info = {
-        'dataset': data,
-        'row_index_levels': row_index_levels,
-        'row_index_values': row_index_values,
-        'column_index_levels': column_index_levels,
-        'column_index_values': column_index_values,
-    }
-    return json.dumps(index_info, indent=2)
+    if data not in dataset_store.sources:
+        return unknown_dataset(data)
+    return get_schema_catalog(data)['indexing_structure']
 
 @tool
 def get_dataset_info_tool(data: str) -> str:
     """
     Provides basic information about the dataset.
 
-    This function uses pandas' info() method to gather and return details about
-    the DataFrame's structure, including data types and non-null counts.
+    Returns a compact summary of the DataFrame's structure, captured once when
+    the dataset was loaded. Use `get_dataset_indexing_structure` for index values.
 
     Parameters:
-    data (str): The name of the dataset to analyze ('df1' or 'df2').
+    data (str): The name of the dataset to analyze (e.g. 'df1' or 'df2').
 
     Returns:
     str: A string containing the DataFrame's info, including:
         - Number of rows and columns
-        - Column names
-        - Non-null counts for each column
-        - Data types of each column
+        - Row and column index level names
+        - Data types and their column counts
+        - Non-null cell count
         - Memory usage
     """
-    df = df1 if data == 'df1' else df2
-    buffer = StringIO()
-    df.info(buf=buffer)
-    df_info = buffer.getvalue()
-    return f"Dataset {data} Information:\n{df_info}"
+    if data not in dataset_store.sources:
+        return unknown_dataset(data)
+    return get_schema_catalog(data)['info']
 
 @tool
 def get_value_from_df(data: str, row_index: tuple, column_index: tuple) -> str:
@@ -92,7 +124,7 @@ def get_value_from_df(data: str, row_index: tuple, column_index: tuple) -> str:
     row and column indices. It handles potential errors and returns informative messages.
 
     Parameters:
-    data (str): The name of the dataset to query ('df1' or 'df2').
+    data (str): The name of the dataset to query (e.g. 'df1' or 'df2').
     row_index (tuple): A 3-element tuple representing (Row Main Category, Row Sub-Category, Value Type).
     column_index (tuple): A 2-element tuple representing (Column Main Category, Column Sub-Category).
 
@@ -101,7 +133,9 @@ def get_value_from_df(data: str, row_index: tuple, column_index: tuple) -> str:
         - The value at the specified indices
         - An error message if the indices are invalid or another exception occurs
     """
-    df = df1 if data == 'df1' else df2
+    if data not in dataset_store.sources:
+        return unknown_dataset(data)
+    df = get_dataset(data)
     try:
         value = df.loc[row_index, column_index]
         return f"Value in {data} at {row_index}, {column_index}: {value}"
@@ -0,0 +1,107 @@
+import math
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Chart settings
+CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', '200'))
+CHART_TOP_N = int(os.getenv('CHART_TOP_N', '20'))
+CHART_MAX_SERIES = int(os.getenv('CHART_MAX_SERIES', '8'))
+
+def format_label(label) -> str:
+    if isinstance(label, tuple):
+        return " / ".join(str(part) for part in label)
+    return str(label)
+
+def format_value(value) -> Optional[float]:
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else round(value, 4)
+
+def is_ordered(index: pd.Index) -> bool:
+    # Numeric and date axes read as a trend; everything else (survey labels) is categorical
+    return index.nlevels == 1 and (pd.api.types.is_numeric_dtype(index) or pd.api.types.is_datetime64_any_dtype(index))
+
+def downsample(series: pd.Series, max_points: int) -> pd.Series:
+    """
+    Keeps max_points evenly spaced points, always including the first and the last.
+    """
+    positions = np.unique(np.linspace(0, len(series) - 1, max_points).round().astype(int))
+    return series.iloc[positions]
+
+def top_n(series: pd.Series, n: int) -> pd.Series:
+    """
+    Keeps the n largest values by magnitude and sums the rest into an 'Other' bar.
+    """
+    order = series.abs().sort_values(ascending=False).index
+    kept = series.loc[order[:n]]
+    rest = series.loc[order[n:]]
+    return pd.concat([kept, pd.Series([rest.sum()], index=['Other'])])
+
+def series_spec(series: pd.Series, title: Optional[str], max_points: int, n: int) -> dict:
+    series = series.dropna()
+    total = len(series)
+    if is_ordered(series.index):
+        chart_type, reduction = 'line', 'downsample' if total > max_points else None
+        if reduction:
+            series = downsample(series.sort_index(), max_points)
+    else:
+        chart_type, reduction = 'bar', 'top_n' if total > n else None
+        if reduction:
+            series = top_n(series, n)
+
+    return {
+        'type': chart_type,
+        'title': title,
+        'x': [format_label(label) for label in series.index],
+        'series': [{'name': format_label(series.name) if series.name is not None else 'value', 'values': [format_value(value) for value in series]}],
+        'total_points': total,
+        'reduction': reduction,
+    }
+
+def frame_spec(df: pd.DataFrame, title: Optional[str], max_points: int, n: int, max_series: int) -> dict:
+    total = df.size
+    reduction = None
+    if df.shape[1] > max_series:
+        # Keep the columns with the largest totals as series
+        df = df[df.abs().sum().sort_values(ascending=False).index[:max_series]]
+        reduction = 'top_n'
+    rows = max(1, min(n, max_points // df.shape[1]))
+    if len(df) > rows:
+        df = df.loc[df.abs().sum(axis=1).sort_values(ascending=False).index[:rows]]
+        reduction = 'top_n'
+
+    return {
+        'type': 'grouped_bar',
+        'title': title,
+        'x': [format_label(label) for label in df.index],
+        'series': [{'name': format_label(column), 'values': [format_value(value) for value in df[column]]} for column in df.columns],
+        'total_points': total,
+        'reduction': reduction,
+    }
+
+def build_chart_spec(value, title: Optional[str] = None, max_points: int = CHART_MAX_POINTS, n: int = CHART_TOP_N, max_series: int = CHART_MAX_SERIES) -> Optional[dict]:
+    """
+    Builds a compact chart spec from a query result, or None when there is nothing to plot.
+
+    Spec: {'type': 'bar' | 'line' | 'grouped_bar', 'title', 'x': [labels],
+           'series': [{'name', 'values'}], 'total_points', 'reduction': None | 'top_n' | 'downsample'}.
+    Categorical results keep their top n entries (the rest summed into 'Other' for a single series),
+    ordered ones are downsampled to max_points, so the spec stays small whatever the result size.
+    """
+    if isinstance(value, pd.DataFrame):
+        numeric = value.select_dtypes(include='number')
+        if numeric.shape[1] == 1:
+            value = numeric.iloc[:, 0]
+        elif numeric.empty:
+            return None
+        else:
+            return frame_spec(numeric, title, max_points, n, max_series)
+
+    if isinstance(value, pd.Series):
+        if not pd.api.types.is_numeric_dtype(value) or value.dropna().size < 2:
+            return None
+        return series_spec(value, title, max_points, n)
+
+    return None
@@ -0,0 +1,23 @@
+from starlette.middleware.gzip import GZipMiddleware
+
+class StreamSafeGZipMiddleware:
+    """
+    GZipMiddleware that leaves the given paths uncompressed. Paths ending in '/' match as prefixes.
+
+    Starlette releases before 0.46 gzip text/event-stream responses too, and the compressor holds
+    back small chunks, so progress events would only reach the client together with the final one.
+    """
+    def __init__(self, app, exclude_paths: tuple = (), **options):
+        self.app = app
+        self.gzip = GZipMiddleware(app, **options)
+        self.exclude_paths = {path for path in exclude_paths if not path.endswith("/")}
+        self.exclude_prefixes = tuple(path for path in exclude_paths if path.endswith("/"))
+
+    def excluded(self, path: str) -> bool:
+        return path in self.exclude_paths or path.startswith(self.exclude_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.excluded(scope["path"]):
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
@@ -0,0 +1,87 @@
+import os
+
+from langchain_core.messages import BaseMessage
+
+# Context budget settings
+CONTEXT_MAX_TOKENS = int(os.getenv('CONTEXT_MAX_TOKENS', '6000'))
+CONTEXT_RESULT_PREVIEW_CHARS = int(os.getenv('CONTEXT_RESULT_PREVIEW_CHARS', '1500'))
+CONTEXT_COMPACT_FORMAT_INSTRUCTIONS = os.getenv('CONTEXT_COMPACT_FORMAT_INSTRUCTIONS', 'true').lower() == 'true'
+
+# Structured output already enforces the schema, so the prompt only needs to name the fields
+COMPACT_SUPERVISOR_FORMAT_INSTRUCTIONS = (
+    "Respond with a SupervisorResponse: 'next_action', 'sub_queries', and on FINISH a 'final_response' "
+    "with 'original_user_query', 'constructed_pandas_query' and 'output'. Leave 'charts' empty; "
+    "the server builds charts from the executed results."
+)
+
+# Names of worker messages that only matter within the turn that produced them
+TOOL_CHATTER = {'EXECUTE_QUERY', 'Schema_Query_Agent'}
+
+try:
+    import tiktoken
+    encoding = tiktoken.get_encoding('o200k_base')
+except Exception:
+    encoding = None
+
+def count_tokens(text: str) -> int:
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def message_tokens(message: BaseMessage) -> int:
+    return count_tokens(str(message.content)) + 4
+
+def truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} characters truncated]"
+
+def compact_messages(messages, max_tokens: int = CONTEXT_MAX_TOKENS, preview_chars: int = CONTEXT_RESULT_PREVIEW_CHARS) -> list:
+    """
+    Builds the message list sent to the Supervisor from the accumulated conversation.
+
+    - Worker chatter (EXECUTE_QUERY results, Schema Query notes) from earlier turns is dropped;
+      earlier turns keep only the user's questions and the Supervisor's answers.
+    - Execution results of the current turn are cut to bounded previews.
+    - The oldest earlier turns are dropped until the context fits in max_tokens.
+
+    The state itself is left untouched; only the returned copy is compacted.
+    """
+    messages = list(messages)
+    # The current turn starts at the latest message from the user (user messages carry no name)
+    turn_start = max((i for i, message in enumerate(messages) if message.type == 'human' and not message.name), default=0)
+
+    history = [message for message in messages[:turn_start] if message.name not in TOOL_CHATTER]
+    current = []
+    for message in messages[turn_start:]:
+        if message.name == 'EXECUTE_QUERY' and isinstance(message.content, str) and len(message.content) > preview_chars:
+            message = message.model_copy(update={'content': truncate(message.content, preview_chars)})
+        current.append(message)
+
+    budget = max_tokens - sum(message_tokens(message) for message in current)
+    kept = []
+    for message in reversed(history):
+        budget -= message_tokens(message)
+        if budget < 0:
+            break
+        kept.append(message)
+
+    return kept[::-1] + current
+
+def usage_of(messages) -> dict:
+    """
+    Sums the token usage reported by the LLM on the given AI messages.
+    """
+    usage = {'input_tokens': 0, 'output_tokens': 0, 'llm_calls': 0}
+    for message in messages:
+        metadata = getattr(message, 'usage_metadata', None)
+        if metadata:
+            usage['input_tokens'] += metadata.get('input_tokens', 0)
+            usage['output_tokens'] += metadata.get('output_tokens', 0)
+            usage['llm_calls'] += 1
+    return usage
+
+def record_token_usage(token_usage: dict, node: str, usage: dict):
+    totals = token_usage.setdefault(node, {'input_tokens': 0, 'output_tokens': 0, 'llm_calls': 0})
+    for key, value in usage.items():
+        totals[key] = totals.get(key, 0) + value
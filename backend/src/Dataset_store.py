@@ -0,0 +1,249 @@
+import glob
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# Dataset store settings
+DATASET_BACKEND = os.getenv('DATASET_BACKEND', 's3')
+DATASET_BUCKET = os.getenv('DATASET_BUCKET', 'ai-powered-dataset-analyzer')
+DATASET_ROOT = os.getenv('DATASET_ROOT', '.')
+DATASET_CACHE_DIR = os.getenv('DATASET_CACHE_DIR', '/tmp/datasense/datasets')
+DATASET_SHARED_MEMORY = os.getenv('DATASET_SHARED_MEMORY', 'false').lower() == 'true'
+# Seconds between checks of the sources for new versions; 0 disables background reloads
+DATASET_POLL_SECONDS = float(os.getenv('DATASET_POLL_SECONDS', '60'))
+
+def parse_mapping(spec: str) -> dict:
+    """
+    Parses 'df3=data/Dataset3.xlsx,df4=data/Dataset4.xlsx' into {'df3': ..., 'df4': ...}.
+    """
+    pairs = (item.split('=', 1) for item in spec.split(',') if '=' in item)
+    return {name.strip(): value.strip() for name, value in pairs}
+
+# Internal dataset name -> object key (S3) or relative path (local backend)
+DATASET_SOURCES = {
+    'df1': os.getenv('DF1_KEY', 'data/Dataset1.xlsx'),
+    'df2': os.getenv('DF2_KEY', 'data/Dataset2.xlsx'),
+    **parse_mapping(os.getenv('DATASET_EXTRA_SOURCES', '')),
+}
+# Internal dataset name -> the title users call it by, for datasets beyond df1/df2
+DATASET_TITLES = parse_mapping(os.getenv('DATASET_TITLES', ''))
+
+class S3Backend:
+    def __init__(self, bucket: str):
+        import boto3
+        self.s3 = boto3.client('s3')
+        self.bucket = bucket
+
+    def fingerprint(self, key: str) -> str:
+        # The ETag changes whenever the object content changes
+        head = self.s3.head_object(Bucket=self.bucket, Key=key)
+        return head['ETag'].strip('"').replace('-', '')
+
+    def read(self, key: str) -> bytes:
+        obj = self.s3.get_object(Bucket=self.bucket, Key=key)
+        return obj['Body'].read()
+
+class LocalBackend:
+    """
+    Reads dataset files from a local directory; a drop-in stand-in for S3 in development.
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self.digests = {}
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def fingerprint(self, key: str) -> str:
+        # Polled regularly, so the file is only hashed again when its size or mtime changes
+        stat = os.stat(self.path(key))
+        cached = self.digests.get(key)
+        if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(self.path(key), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        self.digests[key] = ((stat.st_mtime_ns, stat.st_size), digest.hexdigest())
+        return digest.hexdigest()
+
+    def read(self, key: str) -> bytes:
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+def create_backend():
+    if DATASET_BACKEND == 'local':
+        return LocalBackend(DATASET_ROOT)
+    return S3Backend(DATASET_BUCKET)
+
+def parse_dataset(key: str, data: bytes) -> pd.DataFrame:
+    """
+    Parses a source workbook (or an already converted pickle/parquet file) into the
+    3-level row / 2-level column MultiIndex layout the agents expect.
+    """
+    if key.endswith('.pkl'):
+        return pd.read_pickle(BytesIO(data))
+    if key.endswith('.parquet'):
+        return pd.read_parquet(BytesIO(data))
+
+    df = pd.read_excel(BytesIO(data), header=[0,1], index_col=[0,1,2]).fillna(0)
+    df.index.names = ['Row Main-Category', 'Row Sub-Category', 'Value Type']
+    df.columns.names = ['Column Main-Category', 'Column Sub-Category']
+    return df
+
+class DatasetStore:
+    """
+    Loads datasets lazily, converting each source workbook once into a local pickle.
+
+    Converted files are named `{name}-{fingerprint}.pkl`, where the fingerprint is the S3 ETag
+    or the file's sha256, so every worker on a host reuses the same conversion and only a changed
+    source is downloaded and parsed again. When the source cannot be reached, the most recent
+    local conversion is used instead.
+
+    With shared memory enabled, the numeric block of each dataset is also written to a `.npy`
+    file that every worker memory-maps read-only, so all uvicorn workers on a host share one
+    copy of the values through the page cache and only rebuild the (small) index objects.
+
+    Once a reload has swapped in a new version, the replaced version's files are deleted.
+    """
+    def __init__(self, backend, sources: dict, cache_dir: str = DATASET_CACHE_DIR, shared_memory: bool = DATASET_SHARED_MEMORY):
+        self.backend = backend
+        self.sources = sources
+        self.cache_dir = cache_dir
+        self.shared_memory = shared_memory
+        self.loaded = {}
+        # Full fingerprint of each loaded version, to find its files once it is replaced
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+
+    def cache_path(self, name: str, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}-{fingerprint}.pkl")
+
+    def shared_paths(self, name: str, fingerprint: str):
+        base = os.path.join(self.cache_dir, f"{name}-{fingerprint}")
+        return f"{base}.values.npy", f"{base}.axes.pkl"
+
+    def open_shared(self, name: str, fingerprint: str) -> pd.DataFrame:
+        values_path, axes_path = self.shared_paths(name, fingerprint)
+        index, columns = pd.read_pickle(axes_path)
+        values = np.load(values_path, mmap_mode='r')
+        # copy=False keeps the DataFrame backed by the read-only memory map
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+    def share(self, name: str, fingerprint: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Materializes the dataset's values into a memory-mapped file and returns a zero-copy view.
+
+        Datasets with non-numeric columns cannot be represented as a single block and are
+        returned unchanged.
+        """
+        if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes):
+            print(f"Dataset {name} has non-numeric columns; not sharing it across workers")
+            return df
+
+        values_path, axes_path = self.shared_paths(name, fingerprint)
+        tmp_suffix = f".{os.getpid()}.tmp"
+        # The axes are written first, so an existing values file implies both are complete
+        pd.to_pickle((df.index, df.columns), axes_path + tmp_suffix)
+        os.replace(axes_path + tmp_suffix, axes_path)
+        with open(values_path + tmp_suffix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(df.to_numpy(dtype=np.result_type(*df.dtypes))))
+        os.replace(values_path + tmp_suffix, values_path)
+        return self.open_shared(name, fingerprint)
+
+    def remove_version(self, name: str, fingerprint: str):
+        """
+        Deletes the converted files of a replaced version. Readers that still have its values
+        memory-mapped keep their mapping; the space is freed once the last one lets go.
+        """
+        for path in (self.cache_path(name, fingerprint), *self.shared_paths(name, fingerprint)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not remove {path}: {e}")
+
+    def latest_cached(self, name: str):
+        cached = [path for path in glob.glob(os.path.join(self.cache_dir, f"{name}-*.pkl")) if not path.endswith('.axes.pkl')]
+        return max(cached, key=os.path.getmtime) if cached else None
+
+    def load(self, name: str):
+        """
+        Returns (DataFrame, full fingerprint) for the current version of the dataset.
+        """
+        key = self.sources[name]
+        try:
+            fingerprint = self.backend.fingerprint(key)
+        except Exception as e:
+            path = self.latest_cached(name)
+            if path is None:
+                raise
+            print(f"Could not reach source of {name} ({e}); using cached {path}")
+            fingerprint = os.path.basename(path)[len(name) + 1:-len('.pkl')]
+
+        if self.shared_memory and os.path.exists(self.shared_paths(name, fingerprint)[0]):
+            return self.open_shared(name, fingerprint), fingerprint
+
+        path = self.cache_path(name, fingerprint)
+        if os.path.exists(path):
+            df = pd.read_pickle(path)
+        else:
+            df = parse_dataset(key, self.backend.read(key))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+
+        if self.shared_memory:
+            df = self.share(name, fingerprint, df)
+        return df, fingerprint
+
+    def get(self, name: str):
+        """
+        Returns (DataFrame, version) for the dataset, loading it on first use.
+        """
+        if name not in self.loaded:
+            with self.lock:
+                if name not in self.loaded:
+                    df, fingerprint = self.load(name)
+                    self.fingerprints[name] = fingerprint
+                    self.loaded[name] = (df, fingerprint[:12])
+        return self.loaded[name]
+
+    def reload(self, name: str):
+        # The new version is fully loaded before it replaces the old one, so readers never see a partial dataset
+        df, fingerprint = self.load(name)
+        loaded = (df, fingerprint[:12])
+        with self.lock:
+            replaced = self.fingerprints.get(name)
+            self.fingerprints[name] = fingerprint
+            self.loaded[name] = loaded
+        if replaced is not None and replaced != fingerprint:
+            self.remove_version(name, replaced)
+        return loaded
+
+    def refresh(self) -> list:
+        """
+        Reloads every loaded dataset whose source has changed.
+
+        Returns [(name, old_version, new_version)] for the datasets that were swapped.
+        Datasets not loaded yet are skipped; they pick up the latest version on first use.
+        """
+        changes = []
+        for name, (_, old_version) in list(self.loaded.items()):
+            try:
+                fingerprint = self.backend.fingerprint(self.sources[name])
+            except Exception as e:
+                print(f"Could not check the source of {name} for changes: {e}")
+                continue
+            if fingerprint[:12] == old_version:
+                continue
+            _, new_version = self.reload(name)
+            changes.append((name, old_version, new_version))
+        return changes
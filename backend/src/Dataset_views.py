@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Number of serialized dataset pages kept in memory per worker
+DATASET_PAYLOAD_CACHE_SIZE = int(os.getenv('DATASET_PAYLOAD_CACHE_SIZE', '64'))
+# Pages at least this large are also kept gzipped, so compression happens once per page
+DATASET_GZIP_MIN_BYTES = int(os.getenv('DATASET_GZIP_MIN_BYTES', '1000'))
+DATASET_GZIP_LEVEL = int(os.getenv('DATASET_GZIP_LEVEL', '6'))
+
+def flatten_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the multi-index dataset into a flat table for the frontend.
+    """
+    # Reset index to convert multi-index to columns
+    df_reset = df.reset_index()
+
+    # Flatten column names if they are MultiIndex
+    if isinstance(df_reset.columns, pd.MultiIndex):
+        df_reset.columns = ['_'.join(map(str, col)).strip().replace(' ', '_') for col in df_reset.columns.values]
+    else:
+        df_reset.columns = [str(col).strip().replace(' ', '_') for col in df_reset.columns]
+    return df_reset
+
+def serialize_page(page: pd.DataFrame, fmt: str, total: int, offset: int) -> bytes:
+    meta = f'"total":{total},"offset":{offset},"count":{len(page)}'
+
+    if fmt == 'columnar':
+        columns = json.dumps(list(page.columns), ensure_ascii=False)
+        values = ",".join(page[column].to_json(orient='values', date_format='iso', force_ascii=False) for column in page.columns)
+        return f'{{"columns":{columns},"data":[{values}],{meta}}}'.encode('utf-8')
+
+    if fmt == 'arrow':
+        import pyarrow as pa
+        table = pa.Table.from_pandas(page, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    records = page.to_json(orient='records', date_format='iso', force_ascii=False)
+    return f'{{"data":{records},{meta}}}'.encode('utf-8')
+
+class DatasetPayloadCache:
+    """
+    Per-worker LRU of serialized /datasets responses, keyed by dataset version and request shape.
+
+    The flattened table is built once per dataset version and every page is serialized straight
+    to bytes (and gzipped, when large enough), so repeat requests skip the reset_index, the JSON
+    encoding and the compression.
+    """
+    def __init__(self, max_entries: int = DATASET_PAYLOAD_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.flat = {}
+        self.payloads = OrderedDict()
+        self.lock = threading.Lock()
+
+    def etag(self, name: str, version: str, offset: int, limit, columns, fmt: str) -> str:
+        shape = hashlib.sha1(repr((offset, limit, columns, fmt)).encode('utf-8')).hexdigest()[:16]
+        return f'"{name}-{version}-{shape}"'
+
+    def flattened(self, name: str, version: str, df: pd.DataFrame) -> pd.DataFrame:
+        cached = self.flat.get(name)
+        if cached is None or cached[0] != version:
+            cached = (version, flatten_dataset(df))
+            self.flat[name] = cached
+        return cached[1]
+
+    def payload(self, name: str, version: str, df: pd.DataFrame, offset: int, limit, columns, fmt: str) -> tuple:
+        """
+        Returns the serialized page and its gzipped form (None for small pages),
+        raising KeyError for unknown projected columns.
+        """
+        key = (name, version, offset, limit, columns, fmt)
+        with self.lock:
+            if key in self.payloads:
+                self.payloads.move_to_end(key)
+                return self.payloads[key]
+
+        flat = self.flattened(name, version, df)
+        if columns:
+            missing = [column for column in columns if column not in flat.columns]
+            if missing:
+                raise KeyError(f"Unknown columns: {', '.join(missing)}")
+            flat = flat[list(columns)]
+        page = flat.iloc[offset:offset + limit] if limit is not None else flat.iloc[offset:]
+        body = serialize_page(page, fmt, len(flat), offset)
+        compressed = gzip.compress(body, compresslevel=DATASET_GZIP_LEVEL) if len(body) >= DATASET_GZIP_MIN_BYTES else None
+
+        with self.lock:
+            self.payloads[key] = (body, compressed)
+            while len(self.payloads) > self.max_entries:
+                self.payloads.popitem(last=False)
+        return body, compressed
+
+    def invalidate(self, name: str):
+        """
+        Drops the flattened table and the serialized pages of a dataset that has been reloaded.
+        """
+        with self.lock:
+            self.flat.pop(name, None)
+            for key in [key for key in self.payloads if key[0] == name]:
+                del self.payloads[key]
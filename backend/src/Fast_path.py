@@ -0,0 +1,209 @@
+import difflib
+import os
+import re
+import threading
+from typing import NamedTuple, Optional
+
+from src.Dataset_store import DATASET_TITLES
+
+# Fast path settings
+FAST_PATH_ENABLED = os.getenv('FAST_PATH_ENABLED', 'true').lower() == 'true'
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv('FAST_PATH_MIN_CONFIDENCE', '0.8'))
+
+# Natural language names users give the datasets, mapped to their internal names
+DATASET_ALIASES = {
+    'df1': ['sustainability research survey', 'sustainability survey', 'sustainability research', 'df1'],
+    'df2': ['christmas research survey', 'christmas survey', 'christmas research', 'df2'],
+}
+
+STOPWORDS = {
+    'a', 'an', 'the', 'of', 'in', 'on', 'for', 'to', 'and', 'or', 'is', 'are', 'was', 'were', 'what',
+    'which', 'who', 'how', 'many', 'much', 'did', 'do', 'does', 'from', 'with', 'by', 'at', 'among',
+    'respondents', 'people', 'survey', 'research', 'dataset', 'chose', 'choose', 'said', 'answered',
+}
+PERCENT_WORDS = {'percent', 'percentage', 'proportion', 'share', 'rate'}
+COUNT_WORDS = {'count', 'number', 'total', 'many'}
+# Aggregation, comparison, ranking and negation cues: the answer is not a single cell
+INTENT_WORDS = {
+    'compare', 'compared', 'comparison', 'versus', 'vs', 'difference', 'differ', 'differs', 'than',
+    'average', 'avg', 'mean', 'median', 'sum', 'overall', 'combined', 'ratio', 'correlation',
+    'highest', 'lowest', 'most', 'least', 'max', 'maximum', 'min', 'minimum', 'top', 'bottom', 'rank', 'ranking',
+    'best', 'worst', 'more', 'less', 'fewer', 'increase', 'decrease', 'trend', 'change',
+    'each', 'every', 'all', 'across', 'breakdown', 'distribution', 'list',
+    'not', 'never', 'no', 'none', 'except', 'excluding', 'without', 'other',
+}
+
+# Words that refer back to earlier turns: the question only makes sense with the conversation
+FOLLOW_UP_WORDS = {
+    'it', 'its', 'that', 'those', 'these', 'this', 'they', 'them', 'their', 'same', 'also', 'again',
+    'previous', 'above', 'instead', 'then', 'else',
+}
+
+def tokenize(text) -> list:
+    return re.findall(r'[a-z0-9]+', str(text).lower().replace('%', ' percent '))
+
+def content_tokens(text) -> list:
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+def label_score(label, question_tokens: set) -> float:
+    """
+    Fraction of a label's tokens found in the question, allowing small typos.
+    """
+    tokens = content_tokens(label)
+    if not tokens:
+        return 0.0
+    matched = 0.0
+    for token in tokens:
+        if token in question_tokens:
+            matched += 1
+        elif len(token) > 3 and difflib.get_close_matches(token, question_tokens, n=1, cutoff=0.85):
+            matched += 0.9
+    return matched / len(tokens)
+
+class Resolution(NamedTuple):
+    dataset: str
+    query: str
+    confidence: float
+    row: tuple
+    column: tuple
+
+def to_python(value):
+    # numpy scalars would render as e.g. np.int64(5) inside the generated query
+    return value.item() if hasattr(value, 'item') else value
+
+class DatasetLabels:
+    """
+    Row and column label combinations of one dataset, as used in `df.loc[(row), (column)]` lookups.
+    """
+    def __init__(self, df):
+        self.rows = {}
+        for row_main, row_sub, value_type in df.index:
+            self.rows.setdefault((to_python(row_main), to_python(row_sub)), []).append(to_python(value_type))
+        self.columns = list(dict.fromkeys(tuple(map(to_python, column)) for column in df.columns))
+        self.vocabulary = {token for labels in (*self.rows, *self.columns) for label in labels for token in tokenize(label)}
+
+def intent_cues(question_tokens: set, label_tokens: set) -> set:
+    """
+    Cue words asking for more than one cell, ignoring those that are part of a label (e.g. 'Not sure').
+    """
+    return (question_tokens & INTENT_WORDS) - label_tokens
+
+def best_match(candidates, question_tokens: set):
+    """
+    Scores (main, sub) label pairs against the question and returns (best pair, confidence).
+
+    The sub-category carries most of the weight; a close runner-up lowers the confidence
+    so ambiguous questions fall back to the agent graph.
+    """
+    scored = []
+    for main, sub in candidates:
+        sub_score = label_score(sub, question_tokens)
+        if sub_score == 0:
+            continue
+        scored.append((0.7 * sub_score + 0.3 * label_score(main, question_tokens), (main, sub)))
+    if not scored:
+        return None, 0.0
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    best_score, best = scored[0]
+    if len(scored) > 1 and best_score - scored[1][0] < 0.1:
+        best_score -= 0.3
+    return best, min(best_score / 0.7, 1.0)
+
+def pick_value_type(value_types: list, question_tokens: set):
+    if question_tokens & PERCENT_WORDS and question_tokens & COUNT_WORDS:
+        # Asks for several value types at once
+        return None
+    if len(value_types) == 1:
+        return value_types[0]
+    if question_tokens & PERCENT_WORDS:
+        wanted = PERCENT_WORDS
+    elif question_tokens & COUNT_WORDS:
+        wanted = COUNT_WORDS
+    else:
+        return None
+    matches = [value_type for value_type in value_types if set(tokenize(value_type)) & wanted]
+    return matches[0] if len(matches) == 1 else None
+
+class FastPathResolver:
+    """
+    Answers single-cell lookup questions without the LLM.
+
+    Identifies the dataset from its aliases, matches the question's words against the row and
+    column labels of that dataset and builds the equivalent `df.loc[...]` query. Returns None
+    whenever the match is not confident enough, so the caller can fall back to the agent graph.
+    """
+    def __init__(self, dataset_store, aliases: dict = DATASET_ALIASES, min_confidence: float = FAST_PATH_MIN_CONFIDENCE):
+        self.dataset_store = dataset_store
+        self.aliases = aliases
+        self.min_confidence = min_confidence
+        self.labels = {}
+        self.lock = threading.Lock()
+
+    def dataset_labels(self, name: str) -> DatasetLabels:
+        df, version = self.dataset_store.get(name)
+        cached = self.labels.get(name)
+        # Rebuilt only when the dataset is reloaded with a new version
+        if cached is None or cached[0] != version:
+            with self.lock:
+                cached = (version, DatasetLabels(df))
+                self.labels[name] = cached
+        return cached[1]
+
+    def invalidate(self, name: str):
+        with self.lock:
+            self.labels.pop(name, None)
+
+    def dataset_aliases(self, name: str) -> list:
+        # Datasets beyond df1/df2 are recognised by their configured title and internal name
+        if name in self.aliases:
+            return self.aliases[name]
+        return [alias for alias in (DATASET_TITLES.get(name), name) if alias]
+
+    def identify_dataset(self, question: str) -> Optional[str]:
+        text = " ".join(tokenize(question))
+        mentioned = [
+            name for name in self.dataset_store.sources
+            if any(re.search(rf'\b{re.escape(" ".join(tokenize(alias)))}\b', text) for alias in self.dataset_aliases(name))
+        ]
+        return mentioned[0] if len(mentioned) == 1 else None
+
+    def is_self_contained(self, question: str) -> bool:
+        """
+        True when the question names exactly one dataset and does not refer back to earlier turns,
+        so its answer does not depend on the conversation it was asked in.
+        """
+        return not set(tokenize(question)) & FOLLOW_UP_WORDS and self.identify_dataset(question) is not None
+
+    def resolve(self, question: str) -> Optional[Resolution]:
+        if not FAST_PATH_ENABLED:
+            return None
+        dataset = self.identify_dataset(question)
+        if dataset is None:
+            return None
+
+        labels = self.dataset_labels(dataset)
+        question_tokens = set(tokenize(question))
+        # Aggregations, comparisons and negations need the agent graph, whatever labels they mention
+        if intent_cues(question_tokens, labels.vocabulary):
+            return None
+
+        row, row_confidence = best_match(labels.rows, question_tokens)
+        column, column_confidence = best_match(labels.columns, question_tokens)
+        if row is None or column is None:
+            return None
+        confidence = min(row_confidence, column_confidence)
+        if confidence < self.min_confidence:
+            return None
+        # A cue word is only harmless if it belongs to the labels actually matched
+        matched_tokens = {token for label in (*row, *column) for token in tokenize(label)}
+        if intent_cues(question_tokens, matched_tokens):
+            return None
+
+        value_type = pick_value_type(labels.rows[row], question_tokens)
+        if value_type is None:
+            return None
+
+        row_index = (*row, value_type)
+        query = f"{dataset}.loc[{row_index!r}, {column!r}]"
+        return Resolution(dataset, query, confidence, row_index, column)
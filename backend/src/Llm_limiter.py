@@ -0,0 +1,196 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import os
+import random
+import time
+
+from langchain_openai import ChatOpenAI
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from src.Metrics import current_trace, llm_retries, span
+
+# LLM admission settings, per API worker process
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '300'))
+LLM_BURST = int(os.getenv('LLM_BURST', '10'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+LLM_BACKOFF_SECONDS = float(os.getenv('LLM_BACKOFF_SECONDS', '1'))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv('LLM_BACKOFF_MAX_SECONDS', '20'))
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """
+        Seconds until a token is available (0 when one is available now).
+        """
+        now = time.monotonic()
+        self.refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        # After a rate limit response nobody should try again before the provider allows it
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+def retry_reason(error: Exception):
+    """
+    Returns why a failed LLM call is worth retrying, or None. Mirrors what the OpenAI client
+    retries on its own: rate limits, connection errors and timeouts, 408/409 and 5xx responses.
+    """
+    if isinstance(error, RateLimitError):
+        return 'rate_limit'
+    if isinstance(error, APIConnectionError):
+        return 'connection'
+    if isinstance(error, APIStatusError) and (error.status_code in (408, 409) or error.status_code >= 500):
+        return 'server'
+    return None
+
+class LlmLimiter:
+    """
+    Admission control in front of the LLM provider.
+
+    Calls wait in a priority queue until both a concurrency slot and a rate token are free.
+    Priority is the start time of the request making the call, so requests already in
+    progress finish before new arrivals start using the budget. Rate limit, connection and
+    server errors are retried with exponential backoff and jitter (honouring Retry-After);
+    rate limit errors also pause the whole bucket.
+    """
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        burst: int = LLM_BURST,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.max_retries = max_retries
+        self.active = 0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.wakeup = None
+
+    def priority(self) -> float:
+        trace = current_trace.get()
+        return trace.started if trace is not None else time.perf_counter()
+
+    def dispatch(self):
+        self.wakeup = None
+        while self.waiting and self.active < self.max_concurrency:
+            if self.waiting[0][2].done():
+                # The caller gave up while queued
+                heapq.heappop(self.waiting)
+                continue
+            wait = self.bucket.wait_time()
+            if wait > 0:
+                self.wakeup = asyncio.get_running_loop().call_later(wait, self.dispatch)
+                return
+            _, _, future = heapq.heappop(self.waiting)
+            self.bucket.take()
+            self.active += 1
+            future.set_result(None)
+
+    def release(self):
+        self.active -= 1
+        if self.wakeup is None:
+            self.dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (self.priority(), next(self.counter), future))
+        if self.wakeup is None:
+            self.dispatch()
+        try:
+            with span("llm.queue"):
+                await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller was cancelled; hand the slot back
+                self.release()
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = getattr(getattr(error, 'response', None), 'headers', {}).get('retry-after')
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = LLM_BACKOFF_SECONDS * 2 ** attempt
+        return min(delay, LLM_BACKOFF_MAX_SECONDS) * random.uniform(1, 1.25)
+
+    async def wait_to_retry(self, attempt: int, error: Exception, reason: str):
+        delay = self.backoff(attempt, error)
+        if reason == 'rate_limit':
+            # Only a rate limit concerns every caller; a network or server error is per call
+            self.bucket.block(delay)
+        llm_retries.inc(reason=reason)
+        await asyncio.sleep(delay)
+
+    async def call(self, factory):
+        """
+        Runs factory() (an LLM call) once admitted, retrying on retryable errors (see retry_reason).
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.slot():
+                    return await factory()
+            except Exception as e:
+                reason = retry_reason(e)
+                if reason is None or attempt == self.max_retries:
+                    raise
+                await self.wait_to_retry(attempt, e, reason)
+
+    async def stream(self, factory):
+        """
+        Yields the chunks of factory() (an async iterator) once admitted. Retryable errors are
+        retried only before the first chunk, since emitted chunks cannot be taken back.
+        """
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self.slot():
+                    async for chunk in factory():
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                reason = retry_reason(e)
+                if reason is None or started or attempt == self.max_retries:
+                    raise
+                await self.wait_to_retry(attempt, e, reason)
+
+llm_limiter = LlmLimiter()
+
+class LimitedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose every call (Supervisor, structured output, Schema Query agent) goes through llm_limiter.
+    """
+    async def _agenerate(self, *args, **kwargs):
+        return await llm_limiter.call(lambda: super(LimitedChatOpenAI, self)._agenerate(*args, **kwargs))
+
+    async def _astream(self, *args, **kwargs):
+        async for chunk in llm_limiter.stream(lambda: super(LimitedChatOpenAI, self)._astream(*args, **kwargs)):
+            yield chunk
@@ -0,0 +1,171 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import json
+import threading
+import time
+from typing import Optional
+
+# Histogram buckets in seconds, from cache hits up to long agent runs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in labels) + "}"
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            lines += [f"{self.name}{format_labels(key)} {value}" for key, value in self.values.items()]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return lines
+
+# Metrics are kept per worker process; Prometheus scrapes and aggregates each worker
+request_count = Counter("datasense_requests_total", "Requests handled, by endpoint, serving path and status.")
+request_seconds = Histogram("datasense_request_seconds", "End-to-end request latency in seconds.")
+span_seconds = Histogram("datasense_span_seconds", "Latency of graph nodes, LLM calls, pandas execution and Redis operations.")
+llm_tokens = Counter("datasense_llm_tokens_total", "LLM tokens used, by graph node and direction.")
+llm_calls = Counter("datasense_llm_calls_total", "LLM calls, by graph node.")
+tool_calls = Counter("datasense_tool_calls_total", "Schema Query agent tool calls, by tool.")
+supervisor_iterations = Histogram("datasense_supervisor_iterations", "Supervisor turns per request.", buckets=COUNT_BUCKETS)
+budget_exhausted = Counter("datasense_budget_exhausted_total", "Requests finished early by the per-request budget, by the budget that ran out.")
+llm_retries = Counter("datasense_llm_retries_total", "LLM calls retried after a rate limit, connection or server error.")
+
+METRICS = [request_count, request_seconds, span_seconds, llm_tokens, llm_calls, tool_calls, supervisor_iterations, budget_exhausted, llm_retries]
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+class RequestTrace:
+    """
+    Timing spans and counters collected while serving one request.
+    """
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.flags = {}
+
+    def add_span(self, name: str, started: float, duration: float, **attrs):
+        self.spans.append({"name": name, "start_ms": round((started - self.started) * 1000, 1), "ms": round(duration * 1000, 1), **attrs})
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_header(self) -> str:
+        return json.dumps({
+            "endpoint": self.endpoint,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "flags": self.flags,
+            "counters": self.counters,
+            "spans": self.spans,
+        }, separators=(',', ':'), default=str)
+
+# Set per request; asyncio tasks spawned by the graph inherit it
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+def start_trace(endpoint: str) -> RequestTrace:
+    trace = RequestTrace(endpoint)
+    current_trace.set(trace)
+    return trace
+
+def finish_trace(trace: RequestTrace, status: int):
+    served_by = trace.flags.get("served_by", "none")
+    request_count.inc(endpoint=trace.endpoint, served_by=served_by, status=status)
+    request_seconds.observe(time.perf_counter() - trace.started, endpoint=trace.endpoint, served_by=served_by)
+    if "supervisor_iterations" in trace.counters:
+        supervisor_iterations.observe(trace.counters["supervisor_iterations"])
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """
+    Times a block, recording it in the request trace (if any) and the span histogram.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        span_seconds.observe(duration, span=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(name, started, duration, **attrs)
+
+def traced_node(name: str):
+    """
+    Decorates an async graph node so every run is recorded as a `node.<name>` span.
+    """
+    def decorator(node):
+        @functools.wraps(node)
+        async def wrapper(*args, **kwargs):
+            with span(f"node.{name}"):
+                return await node(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_llm_usage(node: str, usage: dict):
+    llm_calls.inc(usage.get("llm_calls", 0), node=node)
+    llm_tokens.inc(usage.get("input_tokens", 0), node=node, direction="input")
+    llm_tokens.inc(usage.get("output_tokens", 0), node=node, direction="output")
+    trace = current_trace.get()
+    if trace is not None:
+        for key, value in usage.items():
+            trace.count(key, value)
+
+def record_tool_calls(messages):
+    trace = current_trace.get()
+    for message in messages:
+        if getattr(message, "type", None) == "tool":
+            tool_calls.inc(tool=message.name)
+            if trace is not None:
+                trace.count("tool_calls")
+
+def set_flag(name: str, value):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.flags[name] = value
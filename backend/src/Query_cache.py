@@ -0,0 +1,318 @@
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# Answer cache settings
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '5000'))
+ANSWER_CACHE_SEMANTIC = os.getenv('ANSWER_CACHE_SEMANTIC', 'false').lower() == 'true'
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.95'))
+ANSWER_CACHE_EMBEDDING_MODEL = os.getenv('ANSWER_CACHE_EMBEDDING_MODEL', 'text-embedding-3-small')
+# Seconds between syncs of a worker's semantic index with the vectors stored by other workers
+ANSWER_CACHE_INDEX_REFRESH_SECONDS = float(os.getenv('ANSWER_CACHE_INDEX_REFRESH_SECONDS', '5'))
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a natural language query so trivially different phrasings share a cache key.
+
+    Lower-cases the text, unifies quotes, strips trailing punctuation and collapses whitespace.
+    """
+    query = query.lower().replace('’', "'").replace('“', '"').replace('”', '"')
+    query = re.sub(r'\s+', ' ', query).strip()
+    return query.rstrip(' ?.!')
+
+def query_hash(normalized_query: str) -> str:
+    return hashlib.sha256(normalized_query.encode('utf-8')).hexdigest()
+
+class LocalVectorIndex:
+    """
+    In-process cosine similarity index over cached query embeddings.
+
+    The vectors themselves live in Redis so every worker can rebuild the same index;
+    the local copy is synced incrementally (see AnswerCache.refresh_index).
+    """
+    def __init__(self):
+        self.vectors = {}
+        self.keys = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def digests(self) -> set:
+        with self.lock:
+            return set(self.vectors)
+
+    def update(self, added: dict, removed: set):
+        """
+        Adds {digest: vector bytes} and drops the removed digests, then rebuilds the matrix.
+        Blocking; run it in a thread.
+        """
+        with self.lock:
+            vectors = dict(self.vectors)
+        for digest in removed:
+            vectors.pop(digest, None)
+        for digest, value in added.items():
+            vectors[digest] = np.frombuffer(value, dtype=np.float32)
+        keys = list(vectors)
+        matrix = np.vstack([vectors[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        with self.lock:
+            self.vectors, self.keys, self.matrix = vectors, keys, matrix
+
+    def search(self, vector: np.ndarray):
+        with self.lock:
+            if not self.keys:
+                return None, 0.0
+            scores = self.matrix @ vector
+            best = int(np.argmax(scores))
+            return self.keys[best], float(scores[best])
+
+class AnswerCache:
+    """
+    Redis-backed cache of final answers keyed by normalized query and dataset version.
+
+    Exact tier: `answer_cache:{version}:{sha256(normalized query)}` holding the FinalResponse JSON.
+    Semantic tier (optional): embeddings of cached queries, matched by cosine similarity.
+    Entries expire after ANSWER_CACHE_TTL seconds and the least recently used ones are evicted
+    once ANSWER_CACHE_MAX_ENTRIES is exceeded.
+    """
+    def __init__(self, redis_client, embeddings=None):
+        self.redis = redis_client
+        self.embeddings = embeddings
+        self.index = LocalVectorIndex()
+        self.index_version = None
+        self.index_refreshed = 0.0
+
+    def entry_key(self, version: str, digest: str) -> str:
+        return f"answer_cache:{version}:{digest}"
+
+    def lru_key(self, version: str) -> str:
+        return f"answer_cache:lru:{version}"
+
+    def vectors_key(self, version: str) -> str:
+        return f"answer_cache:vectors:{version}"
+
+    async def record(self, outcome: str, amount: int = 1):
+        await self.redis.hincrby("answer_cache:stats", outcome, amount)
+
+    async def stats(self) -> dict:
+        raw = await self.redis.hgetall("answer_cache:stats")
+        counters = {key.decode(): int(value) for key, value in raw.items()}
+        lookups = sum(counters.get(outcome, 0) for outcome in ("exact_hit", "semantic_hit", "miss"))
+        hits = counters.get("exact_hit", 0) + counters.get("semantic_hit", 0)
+        counters["hit_rate"] = hits / lookups if lookups else 0.0
+        return counters
+
+    async def embed(self, normalized_query: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.aembed_query(normalized_query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def refresh_index(self, version: str):
+        """
+        Syncs the local index with the vectors in Redis, at most every ANSWER_CACHE_INDEX_REFRESH_SECONDS:
+        only the digests are listed, and only vectors not yet in the index are fetched.
+        """
+        if self.index_version != version:
+            self.index, self.index_version, self.index_refreshed = LocalVectorIndex(), version, 0.0
+        now = time.monotonic()
+        if now - self.index_refreshed < ANSWER_CACHE_INDEX_REFRESH_SECONDS:
+            return
+        self.index_refreshed = now
+
+        key = self.vectors_key(version)
+        stored = {digest.decode() for digest in await self.redis.hkeys(key)}
+        known = self.index.digests()
+        missing = list(stored - known)
+        added = {}
+        if missing:
+            added = {digest: value for digest, value in zip(missing, await self.redis.hmget(key, missing)) if value is not None}
+        removed = known - stored
+        if added or removed:
+            await asyncio.to_thread(self.index.update, added, removed)
+
+    async def fetch(self, version: str, digest: str):
+        key = self.entry_key(version, digest)
+        cached = await self.redis.get(key)
+        if cached is None:
+            # Expired entries may still linger in the LRU and vector indexes
+            await self.redis.zrem(self.lru_key(version), digest)
+            await self.redis.hdel(self.vectors_key(version), digest)
+            return None
+        await self.redis.zadd(self.lru_key(version), {digest: time.time()})
+        return json.loads(cached)
+
+    async def lookup(self, query: str, version: str):
+        """
+        Returns the cached FinalResponse dict for the query, or None on a miss.
+        """
+        normalized = normalize_query(query)
+        digest = query_hash(normalized)
+
+        answer = await self.fetch(version, digest)
+        if answer is not None:
+            await self.record("exact_hit")
+            return answer
+
+        if ANSWER_CACHE_SEMANTIC and self.embeddings is not None:
+            try:
+                await self.refresh_index(version)
+                match, score = self.index.search(await self.embed(normalized))
+                if match and score >= ANSWER_CACHE_SIMILARITY:
+                    answer = await self.fetch(version, match)
+                    if answer is not None:
+                        await self.record("semantic_hit")
+                        return answer
+            except Exception as e:
+                print(f"Semantic cache lookup failed: {e}")
+
+        await self.record("miss")
+        return None
+
+    async def store(self, query: str, version: str, answer: dict):
+        normalized = normalize_query(query)
+        digest = query_hash(normalized)
+
+        pipe = self.redis.pipeline()
+        pipe.set(self.entry_key(version, digest), json.dumps(answer), ex=ANSWER_CACHE_TTL)
+        pipe.zadd(self.lru_key(version), {digest: time.time()})
+        pipe.expire(self.lru_key(version), ANSWER_CACHE_TTL)
+        vector = None
+        if ANSWER_CACHE_SEMANTIC and self.embeddings is not None:
+            try:
+                vector = (await self.embed(normalized)).tobytes()
+                pipe.hset(self.vectors_key(version), digest, vector)
+                pipe.expire(self.vectors_key(version), ANSWER_CACHE_TTL)
+            except Exception as e:
+                print(f"Could not embed query for semantic cache: {e}")
+        await pipe.execute()
+        # This worker's own entries are searchable right away; other workers pick them up on refresh
+        if vector is not None and self.index_version == version:
+            await asyncio.to_thread(self.index.update, {digest: vector}, set())
+
+        await self.evict(version)
+
+    async def evict(self, version: str):
+        overflow = await self.redis.zcard(self.lru_key(version)) - ANSWER_CACHE_MAX_ENTRIES
+        if overflow <= 0:
+            return
+        stale = [digest.decode() for digest, _ in await self.redis.zpopmin(self.lru_key(version), overflow)]
+        pipe = self.redis.pipeline()
+        pipe.delete(*[self.entry_key(version, digest) for digest in stale])
+        pipe.hdel(self.vectors_key(version), *stale)
+        await pipe.execute()
+        if self.index_version == version:
+            await asyncio.to_thread(self.index.update, {}, set(stale))
+        await self.record("evicted", len(stale))
+
+    async def invalidate(self, version: str):
+        """
+        Drops every answer cached for a dataset version that has been replaced.
+        """
+        digests = [digest.decode() for digest in await self.redis.zrange(self.lru_key(version), 0, -1)]
+        pipe = self.redis.pipeline()
+        if digests:
+            pipe.delete(*[self.entry_key(version, digest) for digest in digests])
+        pipe.delete(self.lru_key(version), self.vectors_key(version))
+        await pipe.execute()
+        await self.record("invalidated", len(digests))
+
+# Constructed query cache settings
+PLAN_CACHE_TTL = int(os.getenv('PLAN_CACHE_TTL', str(7 * 24 * 3600)))
+
+def referenced_datasets(query: str, dataset_versions: dict) -> list:
+    """
+    Returns the internal dataset names ('df1', 'df2', ...) a sub-query refers to,
+    or every known dataset when none is named explicitly.
+    """
+    mentioned = sorted(name for name in dataset_versions if re.search(rf'\b{re.escape(name)}\b', query))
+    return mentioned or sorted(dataset_versions)
+
+class PlanCache:
+    """
+    Redis-backed map from normalized sub-query to a validated constructed pandas query.
+
+    Entries live in one hash per combination of referenced dataset versions, so reloading
+    df1 or df2 leaves the plans built against the old data unreachable until they expire.
+    """
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def plans_key(self, sub_query: str, dataset_versions: dict) -> str:
+        datasets = referenced_datasets(sub_query, dataset_versions)
+        return "plan_cache:" + "+".join(f"{name}@{dataset_versions[name]}" for name in datasets)
+
+    async def record(self, outcome: str):
+        await self.redis.hincrby("plan_cache:stats", outcome, 1)
+
+    async def stats(self) -> dict:
+        raw = await self.redis.hgetall("plan_cache:stats")
+        return {key.decode(): int(value) for key, value in raw.items()}
+
+    async def lookup(self, sub_query: str, dataset_versions: dict):
+        """
+        Returns the constructed pandas query for the sub-query, or None on a miss.
+        """
+        digest = query_hash(normalize_query(sub_query))
+        plan = await self.redis.hget(self.plans_key(sub_query, dataset_versions), digest)
+        await self.record("hit" if plan is not None else "miss")
+        return plan.decode() if plan is not None else None
+
+    async def store(self, sub_query: str, dataset_versions: dict, constructed_query: str):
+        key = self.plans_key(sub_query, dataset_versions)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, query_hash(normalize_query(sub_query)), constructed_query)
+        pipe.expire(key, PLAN_CACHE_TTL)
+        await pipe.execute()
+
+    async def invalidate(self, name: str, version: str):
+        """
+        Drops the plans built against a replaced version of one dataset.
+        """
+        stale = []
+        # The dataset is either the first in the key or follows a '+'
+        for pattern in (f"plan_cache:{name}@{version}*", f"plan_cache:*+{name}@{version}*"):
+            stale += [key async for key in self.redis.scan_iter(match=pattern)]
+        if stale:
+            await self.redis.delete(*stale)
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical work in this process: callers asking for a key that is
+    already being computed await the running task instead of starting their own.
+
+    The work runs as its own task, so a caller that disconnects does not cancel it for the others.
+    """
+    def __init__(self):
+        self.calls = {}
+
+    def running(self, key: str):
+        return self.calls.get(key)
+
+    async def run(self, key: str, factory):
+        """
+        Returns (result, shared); shared is True when the result came from another caller's run.
+        """
+        task = self.calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(factory())
+        self.calls[key] = task
+        task.add_done_callback(functools.partial(self.finished, key))
+        return await asyncio.shield(task), False
+
+    def finished(self, key: str, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Retrieve the error so a run whose callers all went away is not reported as unhandled
+        if not task.cancelled():
+            task.exception()
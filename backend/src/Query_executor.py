@@ -0,0 +1,301 @@
+import ast
+import asyncio
+import contextlib
+import io
+import multiprocessing
+import os
+import resource
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from src.Chart_builder import build_chart_spec
+
+# Execution pool settings
+EXECUTION_POOL_WORKERS = int(os.getenv('EXECUTION_POOL_WORKERS', '2'))
+EXECUTION_POOL_START_METHOD = os.getenv('EXECUTION_POOL_START_METHOD', 'spawn')
+EXECUTION_TIMEOUT_SECONDS = float(os.getenv('EXECUTION_TIMEOUT_SECONDS', '10'))
+# Caps each worker's virtual address space (RLIMIT_AS), not its resident memory: numpy/BLAS thread
+# arenas and memory-mapped datasets count in full, so leave ample headroom. 0 disables the cap.
+EXECUTION_MAX_MEMORY_MB = int(os.getenv('EXECUTION_MAX_MEMORY_MB', '0'))
+# Caps the resident memory a single query may add to its worker (0 disables the guard). A query
+# past the cap is interrupted with a MemoryError; one that keeps growing in C code to twice the cap
+# takes its worker down instead.
+EXECUTION_MAX_RSS_MB = int(os.getenv('EXECUTION_MAX_RSS_MB', '1024'))
+EXECUTION_RSS_POLL_SECONDS = float(os.getenv('EXECUTION_RSS_POLL_SECONDS', '0.05'))
+EXECUTION_RESULT_MAX_CHARS = int(os.getenv('EXECUTION_RESULT_MAX_CHARS', '4000'))
+EXECUTION_RESULT_MAX_ROWS = int(os.getenv('EXECUTION_RESULT_MAX_ROWS', '60'))
+
+# Datasets held by a pool worker process, keyed by name as (version, DataFrame)
+worker_datasets = {}
+worker_store = None
+worker_timeout = EXECUTION_TIMEOUT_SECONDS
+worker_memory_guard = None
+
+
+def run_code(code: str, namespace: dict):
+    """
+    Runs a pandas query the way PythonAstREPLTool does: every statement is executed and the
+    value of a trailing expression is returned, falling back to anything printed.
+    """
+    tree = ast.parse(code)
+    if not tree.body:
+        return None
+
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        exec(compile(ast.Module(body=tree.body[:-1], type_ignores=[]), '<query>', 'exec'), namespace)
+        last = tree.body[-1]
+        if isinstance(last, ast.Expr):
+            value = eval(compile(ast.Expression(last.value), '<query>', 'eval'), namespace)
+        else:
+            exec(compile(ast.Module(body=[last], type_ignores=[]), '<query>', 'exec'), namespace)
+            value = None
+
+    return value if value is not None else stdout.getvalue()
+
+def chart_for(value):
+    # A chart is a bonus; failing to build one must not fail the query
+    try:
+        return build_chart_spec(value)
+    except Exception:
+        return None
+
+def summarize_result(value) -> dict:
+    """
+    Converts a query result into a compact, picklable description with a bounded text preview
+    and, for numeric Series/DataFrames, a chart spec (see Chart_builder).
+    """
+    if isinstance(value, pd.DataFrame):
+        kind, shape = 'DataFrame', list(value.shape)
+        text = value.to_string(max_rows=EXECUTION_RESULT_MAX_ROWS, max_cols=20)
+    elif isinstance(value, pd.Series):
+        kind, shape = 'Series', list(value.shape)
+        text = value.to_string(max_rows=EXECUTION_RESULT_MAX_ROWS)
+    else:
+        kind, shape = 'scalar', None
+        text = str(value)
+
+    truncated = len(text) > EXECUTION_RESULT_MAX_CHARS
+    return {
+        'ok': True,
+        'kind': kind,
+        'shape': shape,
+        'text': text[:EXECUTION_RESULT_MAX_CHARS] + ('...' if truncated else ''),
+        'truncated': truncated,
+        'error': None,
+        'chart': chart_for(value),
+    }
+
+def error_result(error: str) -> dict:
+    return {'ok': False, 'kind': 'error', 'shape': None, 'text': error, 'truncated': False, 'error': error, 'chart': None}
+
+def execute(code: str, datasets: dict) -> dict:
+    started = time.perf_counter()
+    try:
+        outcome = summarize_result(run_code(code, dict(datasets)))
+    except MemoryError as e:
+        outcome = error_result(f"MemoryError: {e or 'query exceeded the available memory'}")
+    except Exception as e:
+        outcome = error_result(f"{type(e).__name__}: {e}")
+    outcome['elapsed_ms'] = (time.perf_counter() - started) * 1000
+    return outcome
+
+def raise_timeout(signum, frame):
+    raise TimeoutError(f"query exceeded {worker_timeout} seconds")
+
+def resident_bytes():
+    # Current resident set size of this process; None where /proc is unavailable
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+class MemoryGuard:
+    """
+    Watchdog thread of a pool worker that polls the worker's resident memory while a query runs.
+
+    Once the query has added more than max_rss_mb since it started, the main thread is interrupted
+    with a MemoryError (which execute() turns into an error result). The interruption only lands
+    between bytecodes, so if the query keeps growing inside a single C call to twice the cap, the
+    worker exits (counted in the pool's shared memory_kills) before it can exhaust the host.
+    """
+    def __init__(self, max_rss_mb: int, memory_kills, poll_seconds: float = EXECUTION_RSS_POLL_SECONDS):
+        self.limit = max_rss_mb * 1024 * 1024
+        self.memory_kills = memory_kills
+        self.poll_seconds = poll_seconds
+        self.baseline = None
+        self.tripped = False
+        signal.signal(signal.SIGUSR1, self.interrupt)
+        threading.Thread(target=self.watch, name='memory-guard', daemon=True).start()
+
+    @contextlib.contextmanager
+    def watching(self):
+        self.tripped = False
+        self.baseline = resident_bytes()
+        try:
+            yield
+        finally:
+            self.baseline = None
+
+    def interrupt(self, signum, frame):
+        # A signal that arrives after the query has finished is ignored
+        if self.baseline is not None:
+            raise MemoryError(f"query used more than {self.limit // (1024 * 1024)} MB of memory")
+
+    def watch(self):
+        main_thread = threading.main_thread().ident
+        while True:
+            time.sleep(self.poll_seconds)
+            baseline = self.baseline
+            if baseline is None:
+                continue
+            rss = resident_bytes()
+            if rss is None:
+                return
+            if rss - baseline > 2 * self.limit:
+                with self.memory_kills.get_lock():
+                    self.memory_kills.value += 1
+                os._exit(1)
+            if rss - baseline > self.limit and not self.tripped:
+                self.tripped = True
+                signal.pthread_kill(main_thread, signal.SIGUSR1)
+
+def init_worker(max_memory_mb: int, max_rss_mb: int, memory_kills):
+    global worker_store, worker_memory_guard
+    from src.Dataset_store import DatasetStore, DATASET_SOURCES, create_backend
+
+    if max_memory_mb:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGALRM, raise_timeout)
+    if max_rss_mb and resident_bytes() is not None:
+        worker_memory_guard = MemoryGuard(max_rss_mb, memory_kills)
+    worker_store = DatasetStore(create_backend(), DATASET_SOURCES)
+
+def worker_bind_datasets(versions: dict) -> dict:
+    """
+    Returns the worker's datasets, reloading any whose version differs from the API process.
+    """
+    for name, version in versions.items():
+        cached = worker_datasets.get(name)
+        if cached is None or cached[0] != version:
+            df, loaded_version = worker_store.get(name)
+            if loaded_version != version:
+                df, loaded_version = worker_store.reload(name)
+            worker_datasets[name] = (loaded_version, df)
+    return {name: worker_datasets[name][1] for name in versions}
+
+def worker_warm_up(versions: dict) -> int:
+    worker_bind_datasets(versions)
+    return os.getpid()
+
+def worker_execute(code: str, versions: dict, timeout: float) -> dict:
+    global worker_timeout
+    worker_timeout = timeout
+    datasets = worker_bind_datasets(versions)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with worker_memory_guard.watching() if worker_memory_guard else contextlib.nullcontext():
+            return execute(code, datasets)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+class QueryExecutor:
+    """
+    Runs constructed pandas queries in a pre-warmed pool of worker processes.
+
+    The pool keeps slow, runaway or crashing queries from stalling or taking down the API process;
+    it is not a sandbox. Queries run with full builtins and the worker's file system and network access.
+    Each worker keeps its own copy of the datasets (memory-mapped when shared memory is enabled),
+    stops queries that add more than EXECUTION_MAX_RSS_MB of resident memory (see MemoryGuard),
+    optionally caps its address space at EXECUTION_MAX_MEMORY_MB and interrupts queries after
+    EXECUTION_TIMEOUT_SECONDS. A worker that does not come back within the grace period is
+    terminated and the pool is rebuilt; queries that were running on the other workers of that pool
+    are retried once on the new one. With EXECUTION_POOL_WORKERS=0 queries run in a thread of the
+    API process instead, without the limits.
+    """
+    def __init__(self, dataset_loader, workers: int = EXECUTION_POOL_WORKERS, timeout: float = EXECUTION_TIMEOUT_SECONDS):
+        self.dataset_loader = dataset_loader
+        self.workers = workers
+        self.timeout = timeout
+        self.pool = None
+
+    def create_pool(self):
+        context = multiprocessing.get_context(EXECUTION_POOL_START_METHOD)
+        # Workers killed by their memory guard, so run() can tell them from crashes
+        memory_kills = context.Value('i', 0)
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(EXECUTION_MAX_MEMORY_MB, EXECUTION_MAX_RSS_MB, memory_kills),
+        )
+        pool.memory_kills = memory_kills
+        return pool
+
+    async def start(self, versions: dict):
+        if self.workers <= 0:
+            return
+        self.pool = self.create_pool()
+        await self.warm_up(versions)
+
+    async def warm_up(self, versions: dict):
+        """
+        Loads the given dataset versions into the workers before a request needs them,
+        at startup and after a dataset is reloaded.
+        """
+        if self.pool is None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, worker_warm_up, versions) for _ in range(self.workers)))
+
+    def restart(self, pool):
+        # Several queries may fail on the same broken pool; only the first one replaces it
+        if pool is not self.pool:
+            return
+        self.pool = self.create_pool()
+        for process in list(getattr(pool, '_processes', {}).values()):
+            process.terminate()
+        # Terminating the workers fails every query still on the old pool with BrokenProcessPool
+        # (rather than cancelling it), so run() can retry them on the new one
+        pool.shutdown(wait=False)
+
+    def shutdown(self, wait: bool = False):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=True)
+
+    async def run(self, code: str, versions: dict) -> dict:
+        """
+        Executes one query and returns its structured result (see summarize_result).
+        """
+        if self.workers <= 0:
+            return await asyncio.to_thread(lambda: execute(code, {name: self.dataset_loader(name) for name in versions}))
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            if self.pool is None:
+                self.pool = self.create_pool()
+            pool = self.pool
+            future = loop.run_in_executor(pool, worker_execute, code, versions, self.timeout)
+            try:
+                # The grace period covers queries stuck in C code that the alarm cannot interrupt
+                return await asyncio.wait_for(future, self.timeout + 5)
+            except asyncio.TimeoutError:
+                self.restart(pool)
+                return error_result(f"TimeoutError: query exceeded {self.timeout} seconds and its worker was restarted")
+            except BrokenProcessPool:
+                # A pool already replaced by another query's timeout or crash: this query was collateral
+                collateral = pool is not self.pool
+                out_of_memory = pool.memory_kills.value > 0
+                self.restart(pool)
+                if collateral and attempt == 0:
+                    continue
+                if out_of_memory:
+                    return error_result(f"MemoryError: query used more than {EXECUTION_MAX_RSS_MB} MB of memory and its worker was restarted")
+                return error_result("WorkerError: the execution worker crashed while running the query")
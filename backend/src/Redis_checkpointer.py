@@ -0,0 +1,180 @@
+import json
+import os
+import zlib
+from typing import Any, AsyncIterator, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+# Checkpointer settings
+CHECKPOINT_TTL = int(os.getenv('CHECKPOINT_TTL', str(24 * 3600)))
+CHECKPOINT_SUBGRAPH_TTL = int(os.getenv('CHECKPOINT_SUBGRAPH_TTL', '600'))
+CHECKPOINT_MAX_MESSAGES = int(os.getenv('CHECKPOINT_MAX_MESSAGES', '40'))
+CHECKPOINT_MAX_BYTES = int(os.getenv('CHECKPOINT_MAX_BYTES', str(256 * 1024)))
+CHECKPOINT_COMPRESS_MIN_BYTES = 1024
+
+class RedisCheckpointSaver(BaseCheckpointSaver):
+    """
+    Async LangGraph checkpointer that keeps only the latest checkpoint of each thread in Redis.
+
+    Unlike MemorySaver, state is shared by every worker and stays bounded:
+    - only the latest checkpoint per (thread, namespace) is kept, with no history,
+    - the message history is trimmed to CHECKPOINT_MAX_MESSAGES and, if the serialized
+      checkpoint is still larger than CHECKPOINT_MAX_BYTES, halved until it fits,
+    - idle sessions expire after CHECKPOINT_TTL seconds (subgraph namespaces after
+      CHECKPOINT_SUBGRAPH_TTL),
+    - payloads above 1 KB are zlib-compressed.
+
+    Only the async API is implemented; the graph is always run with ainvoke/astream.
+    """
+    def __init__(self, redis_client, **kwargs):
+        super().__init__(**kwargs)
+        self.redis = redis_client
+
+    def checkpoint_key(self, thread_id: str, checkpoint_ns: str) -> str:
+        return f"checkpoint:{thread_id}:{checkpoint_ns}"
+
+    def writes_key(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"checkpoint_writes:{thread_id}:{checkpoint_ns}:{checkpoint_id}"
+
+    def ttl(self, checkpoint_ns: str) -> int:
+        return CHECKPOINT_TTL if not checkpoint_ns else CHECKPOINT_SUBGRAPH_TTL
+
+    def dumps(self, obj) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) >= CHECKPOINT_COMPRESS_MIN_BYTES:
+            return f"z:{type_}", zlib.compress(data, 1)
+        return type_, data
+
+    def loads(self, type_: str, data: bytes):
+        if type_.startswith("z:"):
+            type_, data = type_[2:], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    def trim(self, checkpoint: Checkpoint) -> Tuple[str, bytes]:
+        """
+        Serializes the checkpoint with its message history cut down to the configured budget.
+        """
+        checkpoint = {**checkpoint, "channel_values": dict(checkpoint.get("channel_values", {}))}
+        values = checkpoint["channel_values"]
+        messages = list(values.get("messages") or [])[-CHECKPOINT_MAX_MESSAGES:]
+        if "messages" in values:
+            values["messages"] = messages
+
+        type_, data = self.dumps(checkpoint)
+        while len(data) > CHECKPOINT_MAX_BYTES and len(messages) > 1:
+            messages = messages[len(messages) // 2:]
+            values["messages"] = messages
+            type_, data = self.dumps(checkpoint)
+        return type_, data
+
+    def thread_config(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> dict:
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+    async def aget_tuple(self, config: dict) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = await self.redis.hgetall(self.checkpoint_key(thread_id, checkpoint_ns))
+        if not stored:
+            return None
+
+        checkpoint_id = stored[b"id"].decode()
+        requested_id = get_checkpoint_id(config)
+        # Older checkpoints are not retained
+        if requested_id and requested_id != checkpoint_id:
+            return None
+
+        writes = await self.redis.hgetall(self.writes_key(thread_id, checkpoint_ns, checkpoint_id))
+        pending_writes = []
+        for field, value in writes.items():
+            task_id, idx, channel, type_ = json.loads(field)
+            pending_writes.append((idx, task_id, channel, self.loads(type_, value)))
+        pending_writes.sort(key=lambda write: (write[1], write[0]))
+
+        parent_id = stored.get(b"parent_id", b"").decode()
+        return CheckpointTuple(
+            config=self.thread_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint=self.loads(stored[b"checkpoint_type"].decode(), stored[b"checkpoint"]),
+            metadata=self.loads(stored[b"metadata_type"].decode(), stored[b"metadata"]),
+            parent_config=self.thread_config(thread_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=[(task_id, channel, value) for _, task_id, channel, value in pending_writes],
+        )
+
+    async def alist(
+        self,
+        config: Optional[dict],
+        *,
+        filter: Optional[dict] = None,
+        before: Optional[dict] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None or limit == 0:
+            return
+        checkpoint_tuple = await self.aget_tuple({"configurable": {**config["configurable"], "checkpoint_id": None}})
+        if checkpoint_tuple is None:
+            return
+        if before and get_checkpoint_id(before) and checkpoint_tuple.checkpoint["id"] >= get_checkpoint_id(before):
+            return
+        if filter and any(checkpoint_tuple.metadata.get(key) != value for key, value in filter.items()):
+            return
+        yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: dict,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> dict:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id") or ""
+        key = self.checkpoint_key(thread_id, checkpoint_ns)
+
+        checkpoint_type, checkpoint_data = self.trim(checkpoint)
+        metadata_type, metadata_data = self.dumps(metadata)
+
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={
+            "id": checkpoint["id"],
+            "parent_id": parent_id,
+            "checkpoint_type": checkpoint_type,
+            "checkpoint": checkpoint_data,
+            "metadata_type": metadata_type,
+            "metadata": metadata_data,
+        })
+        pipe.expire(key, self.ttl(checkpoint_ns))
+        if parent_id:
+            # Writes of the replaced checkpoint are never read again
+            pipe.delete(self.writes_key(thread_id, checkpoint_ns, parent_id))
+        await pipe.execute()
+
+        return self.thread_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    async def aput_writes(
+        self,
+        config: dict,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = self.writes_key(thread_id, checkpoint_ns, config["configurable"]["checkpoint_id"])
+
+        mapping = {}
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self.dumps(value)
+            mapping[json.dumps([task_id, idx, channel, type_])] = data
+
+        if mapping:
+            pipe = self.redis.pipeline()
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, self.ttl(checkpoint_ns))
+            await pipe.execute()
@@ -1,29 +1,40 @@
-from langchain_openai import ChatOpenAI
+from langchain_openai import OpenAIEmbeddings
 from langchain.output_parsers import PydanticOutputParser
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import create_react_agent
 from langchain.tools.render import render_text_description
-from langchain_experimental.tools import PythonAstREPLTool
-from src.Agent_prompts import get_schema_query_prompt, get_supervisor_prompt
-from src.Agent_tools import df1, df2, get_value_from_df, get_dataset_info_tool, get_dataset_indexing_structure
-from typing import Dict, TypedDict, Annotated, Sequence, List
+from src.Agent_prompts import get_extra_datasets_prompt, get_schema_query_prompt, get_supervisor_prompt
+from src.Agent_tools import dataset_store, forget_schema_catalog, get_dataset, get_dataset_version, get_dataset_versions, get_value_from_df, get_dataset_info_tool, get_dataset_indexing_structure
+from src.Compression import StreamSafeGZipMiddleware
+from src.Dataset_store import DATASET_POLL_SECONDS, DATASET_TITLES
+from src.Context_manager import compact_messages, record_token_usage, usage_of, COMPACT_SUPERVISOR_FORMAT_INSTRUCTIONS, CONTEXT_COMPACT_FORMAT_INSTRUCTIONS
+from src.Dataset_views import DatasetPayloadCache
+from src.Fast_path import FastPathResolver
+from src.Llm_limiter import LimitedChatOpenAI
+from src.Metrics import budget_exhausted, finish_trace, record_llm_usage, record_tool_calls, render_metrics, set_flag, span, start_trace, traced_node
+from src.Query_executor import QueryExecutor
+from src.Redis_checkpointer import RedisCheckpointSaver
+from src.Query_cache import AnswerCache, PlanCache, SingleFlight, normalize_query, query_hash, ANSWER_CACHE_SEMANTIC, ANSWER_CACHE_EMBEDDING_MODEL
+from typing import Dict, TypedDict, Annotated, Sequence, List, Tuple
+import asyncio
+import hashlib
 import operator
 import functools
 import json
-import redis
+import time
+import redis.asyncio as redis
 
-from fastapi import Depends,FastAPI, HTTPException
+from fastapi import Depends,FastAPI, HTTPException, Header, Query, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 
 import os
 import secrets
+import uuid
 from dotenv import load_dotenv
 from datetime import datetime
 
@@ -43,11 +54,26 @@ def get_current_session(credentials: HTTPAuthorizationCredentials = Depends(secu
         token = create_session_token()
     return token
 
-redis_client = redis.Redis(host=os.getenv('REDIS_HOST'), port=int(os.getenv('REDIS_PORT')), db=int(os.getenv('REDIS_DB')))
+redis_pool = redis.ConnectionPool(
+    host=os.getenv('REDIS_HOST'),
+    port=int(os.getenv('REDIS_PORT')),
+    db=int(os.getenv('REDIS_DB')),
+    max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', '50')),
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Every LLM call is queued, rate limited and retried by llm_limiter, so the client itself does not retry
+llm = LimitedChatOpenAI(model="gpt-4o-mini", temperature=0.2, max_retries=0)
+
+# Cache of final answers, checked before running the agent graph
+answer_cache = AnswerCache(
+    redis_client,
+    embeddings=OpenAIEmbeddings(model=ANSWER_CACHE_EMBEDDING_MODEL) if ANSWER_CACHE_SEMANTIC else None,
+)
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2)
+# Cache of validated pandas queries, checked before running the Schema Query agent
+plan_cache = PlanCache(redis_client)
 # Setup for response validation
-import pandas as pd
 from pydantic import BaseModel, Field, ValidationError
 from typing import Optional, Literal
 
@@ -55,7 +81,7 @@ class FinalResponse(BaseModel):
     original_user_query: str = Field(description="The user's original natural language query.")
     constructed_pandas_query: str = Field(description="The single-line final panda's query constructed to answer user's query.")
     output: str = Field(description="The result of the executed single-line panda's query.")
-    charts: Optional[List[Dict]] = Field(default=None, description="List of charts generated, if any.")
+    charts: Optional[List[Dict]] = Field(default=None, description="Leave empty: charts are built by the server from the executed query results.")
 
 class SupervisorResponse(BaseModel):
     next_action: Literal["FINISH", "EXECUTE_QUERY", "Schema_Query_Agent"]
@@ -73,11 +99,10 @@ def validate_response(response):
     except Exception as e:  
         return f"Error parsing final response: {e}"
 
-# Initialize MemorySaver
-memory = MemorySaver()
+# Conversation state lives in Redis so it is bounded and shared by all workers
+memory = RedisCheckpointSaver(redis_client)
 
 # Initialize tools
-python_repl_tool = PythonAstREPLTool(locals={'df1': df1, 'df2': df2})
 schema_query_tools = [get_dataset_info_tool, get_dataset_indexing_structure, get_value_from_df]
 
 # Define the state
@@ -88,9 +113,17 @@ class AgentState(TypedDict):
     constructed_queries: Optional[List[str]]
     current_index: Optional[int]
     results: Optional[List[str]]
+    charts: Optional[List[Dict]]
+    query_sources: Optional[Dict[str, str]]
+    token_usage: Optional[Dict[str, Dict[str, int]]]
+    iterations: Optional[int]
+    executed_count: Optional[int]
+    started_at: Optional[float]
 
 supervisor_parser = PydanticOutputParser(pydantic_object=SupervisorResponse)
-supervisor_prompt = get_supervisor_prompt()
+# Datasets registered beyond df1/df2 are named in both prompts
+extra_datasets_prompt = get_extra_datasets_prompt({name: DATASET_TITLES.get(name, name) for name in dataset_store.sources if name not in ('df1', 'df2')})
+supervisor_prompt = get_supervisor_prompt() + extra_datasets_prompt
 
 # Define the Supervisor node
 supervisor_formatted_prompt = ChatPromptTemplate.from_messages([
@@ -101,106 +134,235 @@ supervisor_formatted_prompt = ChatPromptTemplate.from_messages([
         "Given the conversation above, what should be the next action? "
         "Select one of: {options}",
     ),
-]).partial(options=str(["FINISH", "EXECUTE_QUERY", "Schema_Query_Agent"]), members=", ".join(["Schema_Query_Agent"]), format_instructions=supervisor_parser.get_format_instructions())
-
-def supervisor(state: AgentState) -> AgentState:
-    supervisor_chain = supervisor_formatted_prompt | llm.with_structured_output(SupervisorResponse)
-    response = supervisor_chain.invoke(state)
+]).partial(options=str(["FINISH", "EXECUTE_QUERY", "Schema_Query_Agent"]), members=", ".join(["Schema_Query_Agent"]), format_instructions=COMPACT_SUPERVISOR_FORMAT_INSTRUCTIONS if CONTEXT_COMPACT_FORMAT_INSTRUCTIONS else supervisor_parser.get_format_instructions())
+
+# Per-request budget; once spent, the Supervisor finishes with the results gathered so far
+BUDGET_MAX_ITERATIONS = int(os.getenv('BUDGET_MAX_ITERATIONS', '4'))
+BUDGET_MAX_LLM_CALLS = int(os.getenv('BUDGET_MAX_LLM_CALLS', '24'))
+BUDGET_MAX_SECONDS = float(os.getenv('BUDGET_MAX_SECONDS', '60'))
+# Backstop for LangGraph: each Supervisor iteration takes at most three steps
+GRAPH_RECURSION_LIMIT = 3 * BUDGET_MAX_ITERATIONS + 4
+SCHEMA_QUERY_RECURSION_LIMIT = int(os.getenv('SCHEMA_QUERY_RECURSION_LIMIT', '12'))
+
+TIME_BUDGET_REASON = f"ran for more than {BUDGET_MAX_SECONDS:g} seconds"
+
+def remaining_seconds(state) -> float:
+    return BUDGET_MAX_SECONDS - (time.time() - state['started_at'])
+
+def exhausted_budget(state) -> Optional[Tuple[str, str]]:
+    """
+    Returns (budget, reason) for the first spent part of the request's budget, or None while
+    the Supervisor may keep going.
+    """
+    if state['iterations'] >= BUDGET_MAX_ITERATIONS:
+        return 'iterations', f"reached {BUDGET_MAX_ITERATIONS} Supervisor iterations"
+    if sum(usage.get('llm_calls', 0) for usage in state['token_usage'].values()) >= BUDGET_MAX_LLM_CALLS:
+        return 'llm_calls', f"reached {BUDGET_MAX_LLM_CALLS} LLM calls"
+    if remaining_seconds(state) <= 0:
+        return 'seconds', TIME_BUDGET_REASON
+    return None
+
+def best_effort_response(state, reason: str) -> str:
+    # The current turn starts at the latest message from the user (user messages carry no name)
+    user_query = next((message.content for message in reversed(state['messages']) if message.type == 'human' and not message.name), "")
+    if state['results']:
+        output = f"Partial answer: the request stopped early ({reason}). Results so far: " + " | ".join(state['results'])
+    else:
+        output = f"The request stopped early ({reason}) before any query was executed. Please try a more specific question."
+    return FinalResponse(
+        original_user_query=user_query,
+        constructed_pandas_query="; ".join(state['constructed_queries']),
+        output=output,
+    ).model_dump_json()
+
+def finish_early(state, budget: str, reason: str) -> dict:
+    budget_exhausted.inc(budget=budget)
+    set_flag("budget_exhausted", reason)
+    return {'messages': [HumanMessage(content=best_effort_response(state, reason), name="Supervisor")], 'next': "FINISH"}
+
+# Nodes return only the fields they change; messages are appended by the operator.add reducer,
+# so a node returns just its new messages (returning the whole list would duplicate the history)
+@traced_node("Supervisor")
+async def supervisor(state: AgentState) -> dict:
+    exhausted = exhausted_budget(state)
+    if exhausted is not None:
+        return finish_early(state, *exhausted)
+    iterations = state['iterations'] + 1
+    token_usage = {node: dict(usage) for node, usage in state['token_usage'].items()}
+
+    supervisor_chain = supervisor_formatted_prompt | llm.with_structured_output(SupervisorResponse, include_raw=True)
+    # Send a compacted copy of the conversation; the state keeps the full history.
+    # The call itself must also end within the time budget (including the limiter's queueing and retries)
+    try:
+        with span("llm.Supervisor"):
+            output = await asyncio.wait_for(
+                supervisor_chain.ainvoke({**state, 'messages': compact_messages(state['messages'])}),
+                remaining_seconds(state),
+            )
+    except asyncio.TimeoutError:
+        return {**finish_early(state, 'seconds', TIME_BUDGET_REASON), 'iterations': iterations}
+    usage = usage_of([output['raw']])
+    record_token_usage(token_usage, 'Supervisor', usage)
+    record_llm_usage('Supervisor', {**usage, 'supervisor_iterations': 1})
+    if output['parsed'] is None:
+        raise output['parsing_error'] or ValueError("Supervisor returned no structured response")
+    response = output['parsed']
     next_action = response.next_action
+    update = {'next': next_action, 'iterations': iterations, 'token_usage': token_usage}
 
     if next_action == "Schema_Query_Agent":
-        squeries = response.sub_queries
-        state['sub_queries'] = squeries
-        state['current_index'] = 0
-        state['next'] = next_action
+        update['sub_queries'] = response.sub_queries
+        update['current_index'] = 0
     elif next_action == "EXECUTE_QUERY":
-        state['next'] = next_action
+        pass
     elif next_action == "FINISH":
         final_response = validate_response(response)
         if final_response:
-            state['messages'].append(HumanMessage(content=final_response, name="Supervisor"))
+            update['messages'] = [HumanMessage(content=final_response, name="Supervisor")]
         else:
-            state['messages'].append(HumanMessage(content="No final response provided.", name="Supervisor"))
-        state['next'] = next_action
+            update['messages'] = [HumanMessage(content="No final response provided.", name="Supervisor")]
     else:
-        state['messages'].append(HumanMessage(content="Unexpected error", name="Supervisor"))
-        state['next'] = next_action
+        update['messages'] = [HumanMessage(content="Unexpected error", name="Supervisor")]
 
-    return state
+    return update
 
 # Define the Schema Query node
 schema_query_parser = JsonOutputParser(pydantic_object=SchemaQueryResponse)
-schema_query_prompt = get_schema_query_prompt()
+schema_query_prompt = get_schema_query_prompt() + extra_datasets_prompt
 schema_query_formatted_prompt = ChatPromptTemplate.from_messages([
     ("system", schema_query_prompt),
     MessagesPlaceholder(variable_name="messages"),
     ("human", "Construct a pandas query to answer the question."),
 ]).partial(tools_list=render_text_description(schema_query_tools), tool_names=", ".join(t.name for t in schema_query_tools), format_instructions=schema_query_parser.get_format_instructions())
 
-def schema_query(state, agent):
-    index = state.get('current_index', 0)
-    sub_queries = state.get('sub_queries', [])
-    if not sub_queries:
-        # No sub-queries to process
-        state['messages'].append(HumanMessage(content=f"Did not recieve any sub-queries to construct panda's query", name='Schema_Query_Agent'))
-        state['next'] = 'Supervisor'
-        return state
-
-    if index >= len(sub_queries):
-        state['messages'].append(HumanMessage(content=f"Current Index indicates all sub-queries have been processed.", name='Schema_Query_Agent'))
-        # All sub-queries have been processed
-        state['next'] = "Supervisor"
-        return state
+# Maximum number of Schema Query agents running at once for one request
+SCHEMA_QUERY_CONCURRENCY = int(os.getenv('SCHEMA_QUERY_CONCURRENCY', '4'))
 
-    query_in_play = sub_queries[index]
+async def construct_query(query_in_play, agent, semaphore, timeout):
+    """
+    Returns the constructed pandas query for one sub-query, whether it came from the agent
+    and the agent's token usage. The query is None if the agent did not finish within timeout seconds.
+    """
+    # Reuse a query already validated for this sub-query and dataset version
+    with span("redis.plan_cache.lookup"):
+        query_cons = await plan_cache.lookup(query_in_play, get_dataset_versions())
+    if query_cons is not None:
+        return query_cons, False, {}
 
     agent_state = {'messages': [HumanMessage(content=query_in_play, name="Supervisor")]}
 
-    result = agent.invoke(agent_state)
+    async def run_agent():
+        async with semaphore:
+            with span("agent.Schema_Query_Agent"):
+                return await agent.ainvoke(agent_state, config={"recursion_limit": SCHEMA_QUERY_RECURSION_LIMIT})
+
+    try:
+        result = await asyncio.wait_for(run_agent(), timeout)
+    except asyncio.TimeoutError:
+        return None, False, {}
+    usage = usage_of(result["messages"])
+    record_llm_usage('Schema_Query_Agent', usage)
+    record_tool_calls(result["messages"])
     agent_message = result["messages"][-1].content
     try:
         output = schema_query_parser.parse(agent_message)
     except ValidationError as e:
         print(f"Validation error {e}")
-        output = {'final_query': "print('Could not Construct Pandas Query!')"}
+        return "print('Could not Construct Pandas Query!')", False, usage
 
-    query_cons = output.get("final_query")
-    state['constructed_queries'].append(query_cons)
+    return output.get("final_query"), True, usage
 
-    state['current_index'] = index + 1
-    if state['current_index'] < len(sub_queries):
-        # There are more sub-queries to process
-        state['next'] = "Schema_Query_Agent"
-    else:
-        # All sub-queries processed
-        state['next'] = "EXECUTE_QUERY"
+@traced_node("Schema_Query_Agent")
+async def schema_query(state, agent):
+    index = state.get('current_index', 0)
+    sub_queries = state.get('sub_queries', [])
+    if not sub_queries:
+        # No sub-queries to process
+        return {'messages': [HumanMessage(content=f"Did not recieve any sub-queries to construct panda's query", name='Schema_Query_Agent')], 'next': 'Supervisor'}
 
-    return state
+    if index >= len(sub_queries):
+        # All sub-queries have been processed
+        return {'messages': [HumanMessage(content=f"Current Index indicates all sub-queries have been processed.", name='Schema_Query_Agent')], 'next': "Supervisor"}
+
+    # Construct all remaining sub-queries concurrently, keeping their original order
+    pending = sub_queries[index:]
+    semaphore = asyncio.Semaphore(SCHEMA_QUERY_CONCURRENCY)
+    # Agents still running when the request's time budget runs out are abandoned
+    timeout = max(remaining_seconds(state), 1.0)
+    constructed = await asyncio.gather(*(construct_query(query_in_play, agent, semaphore, timeout) for query_in_play in pending))
+
+    messages = []
+    token_usage = {node: dict(usage) for node, usage in state['token_usage'].items()}
+    query_sources = dict(state['query_sources'])
+    constructed_queries = list(state['constructed_queries'])
+    for query_in_play, (query_cons, from_agent, usage) in zip(pending, constructed):
+        record_token_usage(token_usage, 'Schema_Query_Agent', usage)
+        if query_cons is None:
+            messages.append(HumanMessage(content=f"Ran out of time constructing a query for: {query_in_play}", name='Schema_Query_Agent'))
+            continue
+        if from_agent:
+            # Remember where the query came from so it can be cached once it executes cleanly
+            query_sources[query_cons] = query_in_play
+        constructed_queries.append(query_cons)
+
+    return {
+        'messages': messages,
+        'token_usage': token_usage,
+        'query_sources': query_sources,
+        'constructed_queries': constructed_queries,
+        'current_index': len(sub_queries),
+        'next': "EXECUTE_QUERY",
+    }
 
-schema_query_agent = create_react_agent(llm, tools=schema_query_tools, state_modifier=schema_query_formatted_prompt)
+# Several agents run concurrently inside one node; with a checkpointer they would all share (and overwrite)
+# the same subgraph checkpoint namespace, so each run keeps its state in memory only
+schema_query_agent = create_react_agent(llm, tools=schema_query_tools, state_modifier=schema_query_formatted_prompt, checkpointer=False)
 schema_query_node = functools.partial(schema_query, agent=schema_query_agent)
 
 # Define the Execute Query node
-def execute_query(state: AgentState) -> AgentState:
-    queries_to_execute = state['constructed_queries']
+# LLM-generated pandas code runs in a separate process pool, so a runaway query cannot stall the API
+query_executor = QueryExecutor(dataset_loader=get_dataset)
 
-    if not queries_to_execute:
-        state['messages'].append(HumanMessage(content=f'No queries to execute', name='EXECUTE_QUERY'))
-        return state
-
-    for query in queries_to_execute:
-        try:
-            res = python_repl_tool.run(query)
-        except Exception as e:
-            res = f"Error in {e} in  {query} execution"
+async def run_query(query: str, versions: dict) -> dict:
+    with span("pandas.execute"):
+        return await query_executor.run(query, versions)
 
-        if isinstance(res, (pd.DataFrame, pd.Series)):
-            state['results'].append(res.to_string())
-        else:
-            state['results'].append(str(res))
+@traced_node("EXECUTE_QUERY")
+async def execute_query(state: AgentState) -> dict:
+    # Queries executed in earlier Supervisor iterations already have their results in the conversation
+    queries_to_execute = state['constructed_queries'][state['executed_count']:]
 
-        state['messages'].append(HumanMessage(content=f'The pandas query {query} is executed; the result is {res}.', name='EXECUTE_QUERY'))
-    return state
+    if not queries_to_execute:
+        return {'messages': [HumanMessage(content=f'No new queries to execute', name='EXECUTE_QUERY')]}
+
+    # Independent queries run in parallel across the pool's workers
+    versions = get_dataset_versions()
+    outcomes = await asyncio.gather(*(run_query(query, versions) for query in queries_to_execute))
+
+    messages = []
+    results, charts = list(state['results']), list(state['charts'])
+    query_sources = dict(state['query_sources'])
+    for query, outcome in zip(queries_to_execute, outcomes):
+        res = outcome['text']
+
+        sub_query = query_sources.pop(query, None)
+        if sub_query is not None and outcome['ok']:
+            with span("redis.plan_cache.store"):
+                await plan_cache.store(sub_query, versions, query)
+
+        results.append(res)
+        if outcome.get('chart'):
+            charts.append({**outcome['chart'], 'title': sub_query or query})
+
+        messages.append(HumanMessage(content=f'The pandas query {query} is executed; the result is {res}.', name='EXECUTE_QUERY'))
+
+    return {
+        'messages': messages,
+        'results': results,
+        'charts': charts,
+        'query_sources': query_sources,
+        'executed_count': len(state['constructed_queries']),
+    }
 
 # Create the graph
 workflow = StateGraph(AgentState)
@@ -228,12 +390,11 @@ workflow.add_conditional_edges(
     }
 )
 
-# Set conditional edges from Supervisor
+# Set conditional edges from Schema Query Agent
 workflow.add_conditional_edges(
     "Schema_Query_Agent",
     lambda x: x["next"],
     {
-        "Schema_Query_Agent": "Schema_Query_Agent",
         "EXECUTE_QUERY": "EXECUTE_QUERY",
         "Supervisor": "Supervisor"
     }
@@ -248,7 +409,9 @@ class QueryRequest(BaseModel):
 
 app = FastAPI()
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Server-sent events must reach the client as they are written, so the stream is never compressed;
+# dataset pages are cached already gzipped
+app.add_middleware(StreamSafeGZipMiddleware, minimum_size=1000, exclude_paths=("/query/stream", "/datasets/"))
 
 app.add_middleware(
     CORSMiddleware,
@@ -256,90 +419,528 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace", "ETag"],
 )
 
-@app.get("/datasets/{dataset_name}")
-async def get_dataset(dataset_name: str):
-    try:
-        if dataset_name == 'df1':
-            df = df1
-        elif dataset_name == 'df2':
-            df = df2
-        else:
-            raise HTTPException(status_code=404, detail="Dataset not found")
-
-        # Reset index to convert multi-index to columns
-        df_reset = df.reset_index()
+# Serialized dataset pages, reused until the dataset version changes
+dataset_payloads = DatasetPayloadCache()
 
-        # Flatten column names if they are MultiIndex
-        if isinstance(df_reset.columns, pd.MultiIndex):
-            df_reset.columns = ['_'.join(col).strip().replace(' ', '_') for col in df_reset.columns.values]
-        else:
-            df_reset.columns = [col.strip().replace(' ', '_') for col in df_reset.columns]
+DATASET_MEDIA_TYPES = {
+    'records': 'application/json',
+    'columnar': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
 
-        # Convert DataFrame to JSON with appropriate orientation
-        data_json = df_reset.to_json(orient='records', date_format='iso', force_ascii=False)
+@app.get("/datasets/{dataset_name}")
+async def get_dataset_rows(
+    dataset_name: str,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    columns: Optional[str] = Query(None, description="Comma-separated flattened column names to return."),
+    format: Literal['records', 'columnar', 'arrow'] = 'records',
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
+    if dataset_name not in dataset_store.sources:
+        raise HTTPException(status_code=404, detail="Dataset not found")
 
-        return {"data": json.loads(data_json)}
+    try:
+        df, version = await asyncio.to_thread(dataset_store.get, dataset_name)
+        projection = tuple(column.strip() for column in columns.split(',')) if columns else None
+
+        # Pages are served from the cache already gzipped (these paths bypass the compression
+        # middleware), so each encoding has its own ETag
+        gzip_accepted = "gzip" in (accept_encoding or "").lower()
+        etag = dataset_payloads.etag(dataset_name, version, offset, limit, projection, format)
+        gzip_etag = etag[:-1] + '-gzip"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+        # Revalidation requests are answered before touching the data at all
+        for candidate in ((gzip_etag, etag) if gzip_accepted else (etag,)):
+            if if_none_match and candidate in if_none_match:
+                return Response(status_code=304, headers={**headers, "ETag": candidate})
+
+        body, compressed = await asyncio.to_thread(dataset_payloads.payload, dataset_name, version, df, offset, limit, projection, format)
+        if gzip_accepted and compressed is not None:
+            headers.update({"ETag": gzip_etag, "Content-Encoding": "gzip"})
+            body = compressed
+        return Response(content=body, media_type=DATASET_MEDIA_TYPES[format], headers=headers)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError:
+        raise HTTPException(status_code=406, detail="Arrow output requires pyarrow on the server.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Modify the /query endpoint to handle exceptions
 from openai import RateLimitError, OpenAIError
 
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-@app.post("/query")
-async def handle_query(request: QueryRequest, token: HTTPAuthorizationCredentials = Depends(get_current_session)):
-    user_query = request.query
-
-    state = {
+def build_initial_state(user_query: str) -> dict:
+    return {
         "next": None,
         "messages": [HumanMessage(content=user_query)],
         "sub_queries": [],
         "constructed_queries": [],
         "current_index": 0,
-        "results": []
+        "results": [],
+        "charts": [],
+        "query_sources": {},
+        "token_usage": {},
+        "iterations": 0,
+        "executed_count": 0,
+        "started_at": time.time(),
     }
 
-    config = {"configurable": {"thread_id": token}}
-
+def graph_config(token: str) -> dict:
+    return {"configurable": {"thread_id": token}, "recursion_limit": GRAPH_RECURSION_LIMIT}
+
+# Insight history limits per session
+INSIGHTS_MAX_ITEMS = int(os.getenv('INSIGHTS_MAX_ITEMS', '200'))
+INSIGHTS_TTL = int(os.getenv('INSIGHTS_TTL', str(30 * 24 * 3600)))
+
+# Insight ids ordered by creation time (microseconds) and the insights themselves, by id
+def insight_index_key(token: str) -> str:
+    return f"insight_index:{token}"
+
+def insight_items_key(token: str) -> str:
+    return f"insight_items:{token}"
+
+# Insights saved before the sorted-set layout: a list per session, newest first, without a TTL
+def legacy_insights_key(token: str) -> str:
+    return f"insights:{token}"
+
+def insight_score(date: datetime) -> int:
+    return int(date.timestamp() * 1_000_000)
+
+async def drop_oldest_insights(token: str, stale: list):
+    if stale:
+        pipe = redis_client.pipeline()
+        pipe.zrem(insight_index_key(token), *stale)
+        pipe.hdel(insight_items_key(token), *stale)
+        await pipe.execute()
+
+async def import_legacy_insights(token: str):
+    """
+    Moves a session's legacy insight list into the sorted-set layout and deletes the list.
+    Insights without an id get one derived from their content, so concurrent imports agree.
+    """
+    legacy_key = legacy_insights_key(token)
+    index_key, items_key = insight_index_key(token), insight_items_key(token)
+    with span("redis.insights.import_legacy"):
+        legacy = await redis_client.lrange(legacy_key, 0, INSIGHTS_MAX_ITEMS - 1)
+        pipe = redis_client.pipeline()
+        previous = None
+        for raw in legacy:
+            insight = json.loads(raw)
+            insight = insight if isinstance(insight, dict) else {"output": insight}
+            insight.setdefault("id", hashlib.sha1(raw if isinstance(raw, bytes) else raw.encode('utf-8')).hexdigest()[:32])
+            try:
+                score = insight_score(datetime.fromisoformat(insight["date"]))
+            except (KeyError, TypeError, ValueError):
+                score = insight_score(datetime.now())
+            # The list is newest first; keep that order even for equal or missing dates
+            score = score if previous is None else min(score, previous - 1)
+            previous = score
+            pipe.zadd(index_key, {insight["id"]: score})
+            pipe.hset(items_key, insight["id"], json.dumps(insight))
+        pipe.expire(index_key, INSIGHTS_TTL)
+        pipe.expire(items_key, INSIGHTS_TTL)
+        pipe.delete(legacy_key)
+        pipe.zrange(index_key, 0, -(INSIGHTS_MAX_ITEMS + 1))
+        stale = (await pipe.execute())[-1]
+        await drop_oldest_insights(token, stale)
+
+async def save_insight(token: str, final_message):
+    # Save the insight to Redis, keeping only the newest INSIGHTS_MAX_ITEMS per session.
+    # Work on a copy: coalesced requests share the same final message
+    final_message = dict(final_message) if isinstance(final_message, dict) else {"output": final_message}
+    now = datetime.now()
+    final_message["id"] = uuid.uuid4().hex
+    final_message["date"] = now.isoformat()
+    index_key, items_key = insight_index_key(token), insight_items_key(token)
+
+    pipe = redis_client.pipeline()
+    pipe.zadd(index_key, {final_message["id"]: insight_score(now)})
+    pipe.hset(items_key, final_message["id"], json.dumps(final_message))
+    # Oldest ids beyond the cap
+    pipe.zrange(index_key, 0, -(INSIGHTS_MAX_ITEMS + 1))
+    pipe.expire(index_key, INSIGHTS_TTL)
+    pipe.expire(items_key, INSIGHTS_TTL)
+    pipe.exists(legacy_insights_key(token))
+    with span("redis.save_insight"):
+        results = await pipe.execute()
+        await drop_oldest_insights(token, results[2])
+    if results[-1]:
+        await import_legacy_insights(token)
+    return final_message
+
+async def finalize_answer(user_query: str, answer: dict, cacheable: bool):
+    final_message_content = answer["messages"][-1].content
+
+    # Try to parse the content as JSON
     try:
-        answer = graph.invoke(state, config=config)
-        final_message_content = answer["messages"][-1].content
+        final_message = json.loads(final_message_content)
+    except json.JSONDecodeError:
+        final_message = final_message_content
+
+    if isinstance(final_message, dict):
+        # Charts come from the executed results, never from numbers written out by the LLM
+        final_message["charts"] = answer.get("charts") or None
+
+    # Only well-formed answers that did not depend on earlier turns are worth serving again
+    if isinstance(final_message, dict) and cacheable:
+        version = await asyncio.to_thread(get_dataset_version)
+        with span("redis.answer_cache.store"):
+            await answer_cache.store(user_query, version, final_message)
+
+    return final_message
+
+# Identical first questions of sessions asked while one is already running share that run
+single_flight = SingleFlight()
+
+async def coalescing_key(user_query: str) -> str:
+    # Same scope as the answer cache: the normalized question and the dataset version,
+    # so only sessions without history may lead or join a shared run
+    version = await asyncio.to_thread(get_dataset_version)
+    return f"{version}:{query_hash(normalize_query(user_query))}"
+
+async def run_graph(user_query: str, state: dict, config: dict, cacheable: bool):
+    answer = await graph.ainvoke(state, config=config)
+    return await finalize_answer(user_query, answer, cacheable)
+
+async def has_history(config: dict) -> bool:
+    with span("redis.checkpoint.lookup"):
+        return await memory.aget_tuple(config) is not None
+
+def is_cacheable(user_query: str, fresh: bool) -> bool:
+    # Cached answers ignore the conversation: they are valid for a session's first question, and
+    # for later ones that name their dataset and do not refer back to earlier turns
+    return fresh or fast_path.is_self_contained(user_query)
+
+async def record_turn(config: dict, user_query: str, final_message):
+    """
+    Appends a turn answered without the graph to the session's conversation, as if the
+    Supervisor had finished it, so follow-up questions can refer to it.
+    """
+    content = json.dumps({key: value for key, value in final_message.items() if key != "charts"}) if isinstance(final_message, dict) else str(final_message)
+    update = {"messages": [HumanMessage(content=user_query), HumanMessage(content=content, name="Supervisor")], "next": "FINISH"}
+    with span("redis.checkpoint.record_turn"):
+        await graph.aupdate_state(config, update, as_node="Supervisor")
+
+# Resolves simple single-cell lookups straight into a pandas query
+fast_path = FastPathResolver(dataset_store)
+
+async def answer_without_llm(user_query: str, cacheable: bool):
+    """
+    Tries the answer cache (only when the answer cannot depend on the conversation, see
+    is_cacheable), then the deterministic fast path.
+
+    Returns (final_message, served_by); final_message is None when the agent graph has to run.
+    """
+    # The first request may trigger the lazy dataset load, so keep it off the event loop
+    version = await asyncio.to_thread(get_dataset_version)
+    if cacheable:
+        with span("redis.answer_cache.lookup"):
+            cached_answer = await answer_cache.lookup(user_query, version)
+        if cached_answer is not None:
+            return cached_answer, "cache"
+
+    with span("fast_path.resolve"):
+        resolution = await asyncio.to_thread(fast_path.resolve, user_query)
+    if resolution is not None:
+        outcome = await run_query(resolution.query, await asyncio.to_thread(get_dataset_versions))
+        if outcome['ok']:
+            row_main, row_sub, value_type = resolution.row
+            column_main, column_sub = resolution.column
+            final_message = FinalResponse(
+                original_user_query=user_query,
+                constructed_pandas_query=resolution.query,
+                output=f"{value_type} for '{row_sub}' ({row_main}) and '{column_sub}' ({column_main}) in {resolution.dataset}: {outcome['text']}",
+            ).model_dump()
+            with span("redis.answer_cache.store"):
+                await answer_cache.store(user_query, version, final_message)
+            return final_message, "fast_path"
+
+    return None, "graph"
+
+async def record_served_by(served_by: str):
+    # Counts which path answered each request, to measure the LLM bypass rate
+    set_flag("served_by", served_by)
+    await redis_client.hincrby("query_paths", served_by, 1)
+
+def error_response(e: Exception):
+    if isinstance(e, RateLimitError):
+        return 429, "Rate limit exceeded. Please try again later."
+    if isinstance(e, OpenAIError):
+        return 500, f"OpenAI API error: {str(e)}"
+    return 500, f"An error occurred: {str(e)}"
 
-        # Try to parse the content as JSON
-        try:
-            final_message = json.loads(final_message_content)
-        except json.JSONDecodeError:
-            final_message = final_message_content
+@app.post("/query")
+async def handle_query(
+    request: QueryRequest,
+    response: Response,
+    token: HTTPAuthorizationCredentials = Depends(get_current_session),
+    x_debug_trace: Optional[str] = Header(None),
+):
+    user_query = request.query
+    state = build_initial_state(user_query)
+    config = graph_config(token)
+    trace = start_trace("/query")
 
-        # Save the insight to Redis
-        final_message["date"] = datetime.now().isoformat()
-        redis_client.lpush(f"insights:{token}", json.dumps(final_message))
+    try:
+        fresh = not await has_history(config)
+        cacheable = is_cacheable(user_query, fresh)
+        final_message, served_by = await answer_without_llm(user_query, cacheable)
+        if final_message is not None:
+            await record_turn(config, user_query, final_message)
+        elif fresh:
+            key = await coalescing_key(user_query)
+            final_message, shared = await single_flight.run(key, functools.partial(run_graph, user_query, state, config, cacheable))
+            if shared:
+                # The run belonged to another session; record the turn in this one too
+                await record_turn(config, user_query, final_message)
+                served_by = "coalesced"
+        else:
+            # Follow-ups depend on this session's conversation, so they never share a run
+            final_message = await run_graph(user_query, state, config, cacheable)
+        final_message = await save_insight(token, final_message)
 
-        return {"response": final_message, "token": token}
+        await record_served_by(served_by)
+        finish_trace(trace, 200)
+        if x_debug_trace:
+            response.headers["X-Trace"] = trace.to_header()
+        return {"response": final_message, "token": token, "served_by": served_by}
 
-    except RateLimitError as e:
-        return JSONResponse(
-            status_code=429,
-            content={"detail": "Rate limit exceeded. Please try again later."},
-        )
-    except OpenAIError as e:
-        return JSONResponse(
-            status_code=500,
-            content={"detail": f"OpenAI API error: {str(e)}"},
-        )
     except Exception as e:
+        status_code, detail = error_response(e)
+        finish_trace(trace, status_code)
         return JSONResponse(
-            status_code=500,
-            content={"detail": f"An error occurred: {str(e)}"},
+            status_code=status_code,
+            content={"detail": detail},
+            headers={"X-Trace": trace.to_header()} if x_debug_trace else None,
         )
 
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def describe_update(node: str, update: dict) -> dict:
+    """
+    Picks the fields of a node's state update that are worth showing as progress.
+    """
+    if node == "Supervisor":
+        return {"node": node, "next": update.get("next"), "sub_queries": update.get("sub_queries"), "iteration": update.get("iterations")}
+    if node == "Schema_Query_Agent":
+        return {"node": node, "constructed_queries": update.get("constructed_queries")}
+    if node == "EXECUTE_QUERY":
+        return {"node": node, "results": update.get("results")}
+    return {"node": node}
+
+async def stream_query_events(user_query: str, token: str, debug_trace: bool = False):
+    """
+    Runs the graph and yields server-sent events: `node` for every node transition,
+    `token` for LLM output chunks, then `final` with the response (or `error`).
+    With debug_trace, the final event also carries the request trace.
+    """
+    state = build_initial_state(user_query)
+    config = graph_config(token)
+    trace = start_trace("/query/stream")
+
+    try:
+        fresh = not await has_history(config)
+        cacheable = is_cacheable(user_query, fresh)
+        final_message, served_by = await answer_without_llm(user_query, cacheable)
+        if final_message is not None:
+            await record_turn(config, user_query, final_message)
+            await record_served_by(served_by)
+            final_message = await save_insight(token, final_message)
+            finish_trace(trace, 200)
+            yield format_sse("final", {"response": final_message, "token": token, "served_by": served_by, **({"trace": json.loads(trace.to_header())} if debug_trace else {})})
+            return
+
+        # A streamed run is tied to its client, so it does not lead a shared run; a fresh session can still join one
+        running = single_flight.running(await coalescing_key(user_query)) if fresh else None
+        if running is not None:
+            shared_message = await asyncio.shield(running)
+            await record_turn(config, user_query, shared_message)
+            final_message = await save_insight(token, shared_message)
+            await record_served_by("coalesced")
+            finish_trace(trace, 200)
+            yield format_sse("final", {"response": final_message, "token": token, "served_by": "coalesced", **({"trace": json.loads(trace.to_header())} if debug_trace else {})})
+            return
+
+        async for mode, chunk in graph.astream(state, config=config, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                message, metadata = chunk
+                if message.content:
+                    yield format_sse("token", {"node": metadata.get("langgraph_node"), "content": message.content})
+            else:
+                for node, update in chunk.items():
+                    yield format_sse("node", describe_update(node, update or {}))
+
+        answer = (await graph.aget_state(config)).values
+        final_message = await save_insight(token, await finalize_answer(user_query, answer, cacheable))
+        await record_served_by(served_by)
+        finish_trace(trace, 200)
+        yield format_sse("final", {"response": final_message, "token": token, "served_by": served_by, **({"trace": json.loads(trace.to_header())} if debug_trace else {})})
+
+    except Exception as e:
+        status_code, detail = error_response(e)
+        finish_trace(trace, status_code)
+        yield format_sse("error", {"status": status_code, "detail": detail})
+
+@app.post("/query/stream")
+async def handle_query_stream(
+    request: QueryRequest,
+    token: HTTPAuthorizationCredentials = Depends(get_current_session),
+    x_debug_trace: Optional[str] = Header(None),
+):
+    return StreamingResponse(
+        stream_query_events(request.query, token, debug_trace=bool(x_debug_trace)),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def project_insight(insight: dict, fields: Optional[List[str]], include_charts: bool) -> dict:
+    projected = {key: value for key, value in insight.items() if key != "charts" and (fields is None or key in fields)}
+    projected["id"] = insight.get("id")
+    projected["has_charts"] = bool(insight.get("charts"))
+    if include_charts:
+        projected["charts"] = insight.get("charts")
+    return projected
+
+# One page of insights in a single round trip: the session's total, the page's ids and scores and
+# their payloads, and whether a legacy list still has to be imported
+insights_page_script = redis_client.register_script("""
+local total = redis.call('ZCARD', KEYS[1])
+local page = redis.call('ZREVRANGEBYSCORE', KEYS[1], ARGV[1], '-inf', 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+local ids = {}
+for i = 1, #page, 2 do
+    ids[#ids + 1] = page[i]
+end
+local items = {}
+if #ids > 0 then
+    items = redis.call('HMGET', KEYS[2], unpack(ids))
+end
+return {total, page, items, redis.call('EXISTS', KEYS[3])}
+""")
+
 @app.get("/insights")
-async def get_insights(token: HTTPAuthorizationCredentials = Depends(get_current_session)):
-    if not redis_client.exists(f"insights:{token}"):
+async def get_insights(
+    token: HTTPAuthorizationCredentials = Depends(get_current_session),
+    cursor: Optional[int] = Query(None, ge=0, description="Omit for the newest insights; then pass next_cursor from the previous page."),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = Query(None, description="Comma-separated insight fields to return, e.g. original_user_query,date,output."),
+    include_charts: bool = False,
+):
+    # The cursor is the creation time of the last insight already returned, so insights saved
+    # between pages never shift the next page. One extra id tells whether another page exists.
+    keys = [insight_index_key(token), insight_items_key(token), legacy_insights_key(token)]
+    args = [f"({cursor}" if cursor is not None else "+inf", limit + 1]
+    with span("redis.get_insights"):
+        total, page, insights, legacy = await insights_page_script(keys=keys, args=args)
+        if legacy:
+            await import_legacy_insights(token)
+            total, page, insights, legacy = await insights_page_script(keys=keys, args=args)
+    if not total:
         raise HTTPException(status_code=404, detail="No insights found for this session.")
 
-    insights = redis_client.lrange(f"insights:{token}", 0, -1)
-    return [json.loads(insight) for insight in insights]
\ No newline at end of file
+    # page is the flat [id, score, id, score, ...] reply of ZREVRANGEBYSCORE WITHSCORES
+    scores = page[1::2]
+    has_more = len(scores) > limit
+    projection = [field.strip() for field in fields.split(',')] if fields else None
+    return {
+        "items": [project_insight(json.loads(insight), projection, include_charts) for insight in insights[:limit] if insight is not None],
+        "next_cursor": int(float(scores[limit - 1])) if has_more else None,
+        "total": total,
+    }
+
+@app.get("/insights/{insight_id}")
+async def get_insight(insight_id: str, token: HTTPAuthorizationCredentials = Depends(get_current_session)):
+    pipe = redis_client.pipeline()
+    pipe.hget(insight_items_key(token), insight_id)
+    pipe.exists(legacy_insights_key(token))
+    insight, legacy = await pipe.execute()
+    if insight is None and legacy:
+        await import_legacy_insights(token)
+        insight = await redis_client.hget(insight_items_key(token), insight_id)
+    if insight is None:
+        raise HTTPException(status_code=404, detail="Insight not found.")
+    return json.loads(insight)
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    served_by = {key.decode(): int(value) for key, value in (await redis_client.hgetall("query_paths")).items()}
+    total = sum(served_by.values())
+    return {
+        "answers": await answer_cache.stats(),
+        "plans": await plan_cache.stats(),
+        "served_by": served_by,
+        "llm_bypass_rate": (total - served_by.get("graph", 0)) / total if total else 0.0,
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format; each worker process reports its own metrics
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+async def refresh_datasets() -> list:
+    """
+    Reloads datasets whose source changed and drops everything cached for their old versions.
+    """
+    previous_version = await asyncio.to_thread(get_dataset_version)
+    changes = await asyncio.to_thread(dataset_store.refresh)
+    if not changes:
+        return changes
+
+    for name, old_version, new_version in changes:
+        print(f"Dataset {name} reloaded: {old_version} -> {new_version}")
+        await plan_cache.invalidate(name, old_version)
+        dataset_payloads.invalidate(name)
+        fast_path.invalidate(name)
+        forget_schema_catalog(name)
+    await answer_cache.invalidate(previous_version)
+    # Workers would otherwise load the new version on their next query
+    await query_executor.warm_up(await asyncio.to_thread(get_dataset_versions))
+    return changes
+
+async def watch_datasets():
+    while True:
+        await asyncio.sleep(DATASET_POLL_SECONDS)
+        try:
+            await refresh_datasets()
+        except Exception as e:
+            print(f"Dataset refresh failed: {e}")
+
+@app.post("/datasets/refresh")
+async def refresh_datasets_now():
+    # Checks the sources right away instead of waiting for the next poll
+    changes = await refresh_datasets()
+    return {"reloaded": [{"dataset": name, "old_version": old, "new_version": new} for name, old, new in changes]}
+
+dataset_watcher = None
+
+@app.on_event("startup")
+async def start_query_executor():
+    await query_executor.start(await asyncio.to_thread(get_dataset_versions))
+
+@app.on_event("startup")
+async def start_dataset_watcher():
+    global dataset_watcher
+    if DATASET_POLL_SECONDS > 0:
+        dataset_watcher = asyncio.create_task(watch_datasets())
+
+@app.on_event("shutdown")
+async def stop_dataset_watcher():
+    if dataset_watcher is not None:
+        dataset_watcher.cancel()
+
+@app.on_event("shutdown")
+async def close_redis():
+    await redis_pool.disconnect()
+
+@app.on_event("shutdown")
+async def stop_query_executor():
+    query_executor.shutdown()
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("starlette")
+
+from src.Compression import StreamSafeGZipMiddleware
+
+def http_scope(path):
+    return {"type": "http", "method": "POST", "path": path, "headers": [(b"accept-encoding", b"gzip")]}
+
+def make_app(release):
+    async def app(scope, receive, send):
+        # A first progress event, then the final one only once the test has seen the first
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+        await send({"type": "http.response.body", "body": b"event: progress\ndata: {}\n\n", "more_body": True})
+        await release.wait()
+        await send({"type": "http.response.body", "body": b"event: final\ndata: {}\n\n" + b" " * 2000, "more_body": False})
+    return app
+
+async def first_event_before_final(path):
+    release = asyncio.Event()
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = StreamSafeGZipMiddleware(make_app(release), minimum_size=1000, exclude_paths=("/query/stream",))
+    task = asyncio.create_task(middleware(http_scope(path), receive, send))
+    for _ in range(100):
+        if any(b"event: progress" in message.get("body", b"") for message in sent):
+            break
+        await asyncio.sleep(0.01)
+    else:
+        release.set()
+        await task
+        return False, sent
+    release.set()
+    await task
+    return True, sent
+
+def test_stream_events_arrive_before_the_final_one():
+    arrived, sent = asyncio.run(first_event_before_final("/query/stream"))
+    assert arrived
+    headers = dict(sent[0]["headers"])
+    assert b"content-encoding" not in headers
+    assert b"event: final" in sent[-1]["body"]
+
+def test_other_paths_are_still_compressed():
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b"[" + b"1," * 1000 + b"1]"})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = StreamSafeGZipMiddleware(app, minimum_size=1000, exclude_paths=("/query/stream",))
+    asyncio.run(middleware(http_scope("/datasets/df1"), receive, send))
+    assert dict(sent[0]["headers"])[b"content-encoding"] == b"gzip"
+
+def test_prefix_paths_are_passed_through():
+    middleware = StreamSafeGZipMiddleware(None, exclude_paths=("/query/stream", "/datasets/"))
+    assert middleware.excluded("/datasets/df1")
+    assert middleware.excluded("/query/stream")
+    assert not middleware.excluded("/query/stream/other")
+    assert not middleware.excluded("/insights")
@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+
+from src.Dataset_store import DatasetStore, LocalBackend
+
+def write_source(root, value, rows=3):
+    df = pd.DataFrame({'Yes': [value] * rows, 'No': [1.0] * rows}, index=[f'Segment {i}' for i in range(rows)])
+    df.to_pickle(os.path.join(root, 'df1.pkl'))
+
+def test_reload_removes_the_replaced_version(tmp_path):
+    source_dir, cache_dir = tmp_path / 'source', tmp_path / 'cache'
+    source_dir.mkdir()
+    write_source(source_dir, 1.0)
+    store = DatasetStore(LocalBackend(str(source_dir)), {'df1': 'df1.pkl'}, cache_dir=str(cache_dir), shared_memory=True)
+
+    old_df, old_version = store.get('df1')
+    old_files = sorted(os.listdir(cache_dir))
+    assert len(old_files) == 3
+
+    write_source(source_dir, 2.0, rows=4)
+    [(name, previous, new_version)] = store.refresh()
+    assert (name, previous) == ('df1', old_version)
+    assert new_version != old_version
+
+    files = sorted(os.listdir(cache_dir))
+    assert len(files) == 3
+    assert not set(files) & set(old_files)
+    # A reader still holding the replaced version keeps its memory map
+    assert old_df['Yes'].sum() == 3.0
+    assert store.get('df1')[0]['Yes'].sum() == 8.0
+
+def test_unchanged_source_keeps_its_files(tmp_path):
+    source_dir, cache_dir = tmp_path / 'source', tmp_path / 'cache'
+    source_dir.mkdir()
+    write_source(source_dir, 1.0)
+    store = DatasetStore(LocalBackend(str(source_dir)), {'df1': 'df1.pkl'}, cache_dir=str(cache_dir))
+
+    store.get('df1')
+    files = sorted(os.listdir(cache_dir))
+    store.reload('df1')
+    assert sorted(os.listdir(cache_dir)) == files
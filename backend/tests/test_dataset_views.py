@@ -0,0 +1,22 @@
+import gzip
+
+import pandas as pd
+
+from src.Dataset_views import DatasetPayloadCache
+
+def make_dataset(rows):
+    index = pd.MultiIndex.from_tuples([('Age', str(i)) for i in range(rows)], names=['Row Main-Category', 'Row Sub-Category'])
+    columns = pd.MultiIndex.from_tuples([('Do you recycle?', 'Yes'), ('Do you recycle?', 'No')])
+    return pd.DataFrame([[1.0, 2.0]] * rows, index=index, columns=columns)
+
+def test_large_pages_are_cached_gzipped():
+    cache = DatasetPayloadCache()
+    body, compressed = cache.payload('df1', 'v1', make_dataset(200), 0, 100, None, 'records')
+    assert gzip.decompress(compressed) == body
+    # Served from the cache, without serializing or compressing again
+    assert cache.payload('df1', 'v1', None, 0, 100, None, 'records')[1] is compressed
+
+def test_small_pages_are_not_gzipped():
+    body, compressed = DatasetPayloadCache().payload('df1', 'v1', make_dataset(2), 0, None, None, 'records')
+    assert b'"total":2' in body
+    assert compressed is None
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+from src.Fast_path import FastPathResolver
+
+def make_dataset():
+    index = pd.MultiIndex.from_tuples(
+        [(main, sub, value_type) for main, sub in [('Age', '18-24'), ('Gender', 'Female'), ('Gender', 'Male')] for value_type in ['Count', 'Percentage']],
+        names=['Row Main-Category', 'Row Sub-Category', 'Value Type'],
+    )
+    columns = pd.MultiIndex.from_tuples(
+        [('Do you recycle?', 'Yes'), ('Do you recycle?', 'No'), ('Do you recycle?', 'Not sure')],
+        names=['Column Main-Category', 'Column Sub-Category'],
+    )
+    return pd.DataFrame([[1.0, 2.0, 3.0]] * len(index), index=index, columns=columns)
+
+class FakeStore:
+    def __init__(self):
+        self.sources = {'df1': 'df1.pkl', 'df2': 'df2.pkl'}
+        self.frames = {'df1': make_dataset(), 'df2': make_dataset()}
+
+    def get(self, name):
+        return self.frames[name], 'v1'
+
+@pytest.fixture
+def resolver():
+    return FastPathResolver(FakeStore())
+
+def test_resolves_single_cell_lookup(resolver):
+    resolution = resolver.resolve("What percentage of Female respondents answered Yes to Do you recycle in the sustainability survey?")
+    assert resolution is not None
+    assert resolution.query == "df1.loc[('Gender', 'Female', 'Percentage'), ('Do you recycle?', 'Yes')]"
+
+def test_cue_word_inside_matched_label_is_allowed(resolver):
+    resolution = resolver.resolve("What percentage of Female respondents answered Not sure to Do you recycle in the sustainability survey?")
+    assert resolution is not None
+    assert resolution.column == ('Do you recycle?', 'Not sure')
+
+@pytest.mark.parametrize("question", [
+    "Compare the percentage of Female and Male respondents who answered Yes to Do you recycle in the sustainability survey",
+    "What is the difference between Female and Male percentage answering Yes to Do you recycle in the sustainability survey?",
+    "What is the average percentage of Female respondents answering Yes to Do you recycle in the sustainability survey?",
+    "Which group has the highest percentage of Female answering Yes to Do you recycle in the sustainability survey?",
+    "What percentage of Female respondents did not answer Yes to Do you recycle in the sustainability survey?",
+    "Female vs Male percentage answering Yes to Do you recycle in the sustainability survey",
+])
+def test_rejects_aggregation_comparison_and_negation(resolver, question):
+    assert resolver.resolve(question) is None
+
+def test_rejects_several_value_types(resolver):
+    assert resolver.resolve("What is the count and percentage of Female respondents answering Yes to Do you recycle in the sustainability survey?") is None
+
+def test_requires_exactly_one_dataset(resolver):
+    assert resolver.resolve("What percentage of Female respondents answered Yes to Do you recycle?") is None
+    assert resolver.resolve("What percentage of Female respondents answered Yes to Do you recycle in the sustainability survey and the christmas survey?") is None
+
+def test_self_contained_questions(resolver):
+    assert resolver.is_self_contained("What percentage of Female respondents answered Yes to Do you recycle in the sustainability survey?")
+    # Refers back to an earlier turn
+    assert not resolver.is_self_contained("And what about that for Male respondents in the sustainability survey?")
+    # No dataset, or more than one
+    assert not resolver.is_self_contained("What percentage of Female respondents answered Yes?")
+    assert not resolver.is_self_contained("Is Yes higher in the sustainability survey or the christmas survey?")
@@ -0,0 +1,56 @@
+import asyncio
+
+import httpx
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+import openai
+
+from src import Llm_limiter
+from src.Llm_limiter import LlmLimiter, retry_reason
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+def status_error(error_class, status):
+    return error_class("error", response=httpx.Response(status, request=REQUEST), body=None)
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(Llm_limiter, "LLM_BACKOFF_SECONDS", 0.001)
+
+def test_retry_reasons():
+    assert retry_reason(status_error(openai.RateLimitError, 429)) == 'rate_limit'
+    assert retry_reason(openai.APIConnectionError(request=REQUEST)) == 'connection'
+    assert retry_reason(openai.APITimeoutError(request=REQUEST)) == 'connection'
+    assert retry_reason(status_error(openai.InternalServerError, 503)) == 'server'
+    assert retry_reason(status_error(openai.BadRequestError, 400)) is None
+    assert retry_reason(ValueError("not an API error")) is None
+
+@pytest.mark.parametrize("error", [
+    openai.APIConnectionError(request=REQUEST),
+    openai.APITimeoutError(request=REQUEST),
+    status_error(openai.InternalServerError, 500),
+])
+def test_transient_errors_are_retried(error):
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise error
+        return "ok"
+
+    assert asyncio.run(LlmLimiter(max_retries=4).call(flaky)) == "ok"
+    assert len(attempts) == 3
+
+def test_client_errors_are_not_retried():
+    attempts = []
+
+    async def bad_request():
+        attempts.append(1)
+        raise status_error(openai.BadRequestError, 400)
+
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(LlmLimiter(max_retries=4).call(bad_request))
+    assert len(attempts) == 1
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from src import Query_cache
+from src.Query_cache import AnswerCache
+
+class FakeEmbeddings:
+    # Queries that share their first word embed to the same direction
+    async def aembed_query(self, text):
+        return [1.0, 0.0] if text.startswith('share') else [0.0, 1.0]
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    monkeypatch.setattr(Query_cache, "ANSWER_CACHE_SEMANTIC", True)
+    monkeypatch.setattr(Query_cache, "ANSWER_CACHE_INDEX_REFRESH_SECONDS", 0)
+    return fakeredis.aioredis.FakeRedis()
+
+def test_semantic_index_syncs_incrementally(redis_client):
+    async def scenario():
+        writer, reader = AnswerCache(redis_client, FakeEmbeddings()), AnswerCache(redis_client, FakeEmbeddings())
+        await writer.store("share of recyclers", "v1", {"output": "40%"})
+        assert await writer.lookup("share of people who recycle", "v1") == {"output": "40%"}
+
+        # Another worker fetches only the vectors it does not have yet
+        assert await reader.lookup("share of people who recycle", "v1") == {"output": "40%"}
+        await writer.store("count of recyclers", "v1", {"output": "12"})
+        fetched = []
+        hmget = redis_client.hmget
+        async def counting_hmget(key, digests):
+            fetched.extend(digests)
+            return await hmget(key, digests)
+        redis_client.hmget = counting_hmget
+        assert await reader.lookup("count of people who recycle", "v1") == {"output": "12"}
+        assert len(fetched) == 1
+        assert len(reader.index) == 2
+
+    asyncio.run(scenario())
+
+def test_refresh_is_rate_limited(redis_client, monkeypatch):
+    monkeypatch.setattr(Query_cache, "ANSWER_CACHE_INDEX_REFRESH_SECONDS", 60)
+
+    async def scenario():
+        writer, reader = AnswerCache(redis_client, FakeEmbeddings()), AnswerCache(redis_client, FakeEmbeddings())
+        await reader.refresh_index("v1")
+        await writer.store("share of recyclers", "v1", {"output": "40%"})
+        # Not visible to the other worker until its next sync
+        assert await reader.lookup("share of people who recycle", "v1") is None
+        reader.index_refreshed = 0.0
+        assert await reader.lookup("share of people who recycle", "v1") == {"output": "40%"}
+
+    asyncio.run(scenario())
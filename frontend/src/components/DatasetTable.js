@@ -65,7 +65,15 @@ const DatasetTable = ({ datasetName }) => {
 
       setLoading(true);
       try {
-        const data = await fetchDataset(datasetName);
+        const data = await fetchDataset(datasetName, {
+          // Render the first pages while the rest of the table is still streaming in
+          onPage: (rows) => {
+            if (isMounted) {
+              setDataset(rows);
+              setLoading(false);
+            }
+          },
+        });
         datasetCache[datasetName] = data; // Cache the fetched data
         if (isMounted) {
           setDataset(data);
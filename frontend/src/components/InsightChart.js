@@ -0,0 +1,84 @@
+import React from 'react';
+import {
+  BarChart,
+  Bar,
+  LineChart,
+  Line,
+  XAxis,
+  YAxis,
+  Tooltip,
+  Legend,
+  ResponsiveContainer,
+  CartesianGrid,
+} from 'recharts';
+import Typography from '@mui/material/Typography';
+
+const COLORS = ['#ff4081', '#7c4dff', '#00e5ff', '#ffab40', '#69f0ae', '#ffd740', '#40c4ff', '#ff6e40'];
+
+// Chart specs are built by the backend from the executed query result:
+// { type: 'bar' | 'line' | 'grouped_bar', title, x: [labels], series: [{ name, values }], total_points, reduction }
+const toRows = (spec) =>
+  spec.x.map((label, index) => {
+    const row = { name: label };
+    spec.series.forEach((series) => {
+      row[series.name] = series.values[index];
+    });
+    return row;
+  });
+
+const describeReduction = (spec) => {
+  if (spec.reduction === 'top_n') {
+    return `Showing the largest values of ${spec.total_points} data points`;
+  }
+  if (spec.reduction === 'downsample') {
+    return `Showing ${spec.x.length} of ${spec.total_points} data points`;
+  }
+  return null;
+};
+
+const InsightChart = ({ spec, height = 300 }) => {
+  if (!spec || !Array.isArray(spec.x) || !Array.isArray(spec.series)) {
+    return null;
+  }
+
+  const rows = toRows(spec);
+  const note = describeReduction(spec);
+  const Chart = spec.type === 'line' ? LineChart : BarChart;
+
+  return (
+    <div style={{ marginTop: 20 }}>
+      {spec.title && <Typography variant="subtitle1">{spec.title}</Typography>}
+      <div style={{ width: '100%', height }}>
+        <ResponsiveContainer width="100%" height="100%">
+          <Chart data={rows}>
+            <CartesianGrid stroke="#555" />
+            <XAxis dataKey="name" stroke="#ffffff" />
+            <YAxis stroke="#ffffff" />
+            <Tooltip
+              contentStyle={{ backgroundColor: '#333', borderColor: '#777' }}
+              itemStyle={{ color: '#ffffff' }}
+              labelStyle={{ color: '#ffffff' }}
+            />
+            {spec.series.length > 1 && (
+              <Legend wrapperStyle={{ color: '#ffffff' }} iconType="circle" align="right" verticalAlign="top" />
+            )}
+            {spec.series.map((series, index) =>
+              spec.type === 'line' ? (
+                <Line key={series.name} type="monotone" dataKey={series.name} stroke={COLORS[index % COLORS.length]} dot={false} />
+              ) : (
+                <Bar key={series.name} dataKey={series.name} fill={COLORS[index % COLORS.length]} />
+              )
+            )}
+          </Chart>
+        </ResponsiveContainer>
+      </div>
+      {note && (
+        <Typography variant="caption" color="text.secondary">
+          {note}
+        </Typography>
+      )}
+    </div>
+  );
+};
+
+export default InsightChart;
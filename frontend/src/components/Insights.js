@@ -1,21 +1,37 @@
 import React, { useState } from 'react';
-import { getInsights } from '../services/api';
+import { streamInsights } from '../services/api';
 import Button from '@mui/material/Button';
 import TextField from '@mui/material/TextField';
 import Typography from '@mui/material/Typography';
 import Paper from '@mui/material/Paper';
 import Loader from './Loader';
+import InsightChart from './InsightChart';
 
 const Insights = () => {
   const [query, setQuery] = useState('');
   const [insight, setInsight] = useState(null);
   const [error, setError] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [progress, setProgress] = useState('');
+
+  const describeProgress = (event, data) => {
+    if (event !== 'node') {
+      return;
+    }
+    if (data.node === 'Supervisor') {
+      setProgress(`Supervisor decided: ${data.next}`);
+    } else if (data.node === 'Schema_Query_Agent') {
+      setProgress(`Constructed query: ${(data.constructed_queries || []).slice(-1)[0] || ''}`);
+    } else if (data.node === 'EXECUTE_QUERY') {
+      setProgress('Executed pandas queries');
+    }
+  };
 
   const handleSubmit = async () => {
     setLoading(true);
+    setProgress('');
     try {
-      const response = await getInsights(query);
+      const response = await streamInsights(query, describeProgress);
       setInsight(response);
       setError(null);
     } catch (error) {
@@ -44,13 +60,23 @@ const Insights = () => {
         {loading ? 'Fetching...' : 'Get Insights'}
       </Button>
       {loading ? (
-        <Loader />
+        <>
+          <Loader />
+          {progress && (
+            <Typography variant="body2" sx={{ marginTop: 1 }}>
+              {progress}
+            </Typography>
+          )}
+        </>
       ) : (
         <>
           {insight && (
             <div style={{ marginTop: 20 }}>
               <Typography variant="h6">Insight:</Typography>
-              <pre>{JSON.stringify(insight, null, 2)}</pre>
+              <pre>{JSON.stringify({ ...insight, charts: undefined }, null, 2)}</pre>
+              {(insight.charts || []).map((spec, index) => (
+                <InsightChart key={index} spec={spec} />
+              ))}
             </div>
           )}
           {error && (
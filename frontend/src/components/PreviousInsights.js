@@ -7,18 +7,28 @@ import {
  ListItemText, 
  Divider, 
  IconButton,
- Box 
+ Box,
+ Button
 } from '@mui/material';
 import FullscreenIcon from '@mui/icons-material/Fullscreen';
 import FullscreenChartDialog from './FullscreenChartDialog';
-import { fetchInsights } from '../services/api';
+import { fetchInsights, fetchInsight } from '../services/api';
 import Loader from './Loader';  // Import the custom Loader
+import InsightChart from './InsightChart';
 
 const PreviousInsights = () => {
  const [insights, setInsights] = useState([]);
  const [fullscreenChart, setFullscreenChart] = useState(null);
  const [error, setError] = useState(null);
  const [loading, setLoading] = useState(true);
+ const [nextCursor, setNextCursor] = useState(null);
+ const [loadingMore, setLoadingMore] = useState(false);
+
+ // Merge by id so a page is never shown twice (e.g. after a retried request)
+ const appendInsights = (current, page) => {
+   const seen = new Set(current.map((item) => item.id));
+   return current.concat(page.filter((item) => !seen.has(item.id)));
+ };
 
  useEffect(() => {
    const getInsights = async () => {
@@ -32,7 +42,8 @@ const PreviousInsights = () => {
         return;
       }
       const data = await fetchInsights();
-      setInsights(data || []);
+      setInsights(data.insights || []);
+      setNextCursor(data.nextCursor);
       setError(null);
     } catch (error) {
       console.error('Error fetching insights:', error);
@@ -45,8 +56,28 @@ const PreviousInsights = () => {
   getInsights();
  }, []);
 
- const handleOpenFullscreen = (chart) => {
-   setFullscreenChart(chart);
+ const handleLoadMore = async () => {
+   try {
+     setLoadingMore(true);
+     const data = await fetchInsights({ cursor: nextCursor });
+     setInsights((current) => appendInsights(current, data.insights || []));
+     setNextCursor(data.nextCursor);
+   } catch (error) {
+     console.error('Error fetching more insights:', error);
+     setError('Failed to fetch insights. Please try again later.');
+   } finally {
+     setLoadingMore(false);
+   }
+ };
+
+ const handleOpenFullscreen = async (item) => {
+   try {
+     // Charts are not part of the history listing; load them on demand
+     const detail = await fetchInsight(item.id);
+     setFullscreenChart(detail.chart || []);
+   } catch (error) {
+     console.error('Error fetching insight chart:', error);
+   }
  };
 
  const handleCloseFullscreen = () => {
@@ -79,7 +110,7 @@ const PreviousInsights = () => {
        <Typography variant="h6" gutterBottom>Previous Insights</Typography>
        <List>
          {insights.map((item, index) => (
-           <React.Fragment key={index}>
+           <React.Fragment key={item.id || index}>
              <ListItem alignItems="flex-start">
                <ListItemText
                  primary={`Query: ${item.query}`}
@@ -93,7 +124,7 @@ const PreviousInsights = () => {
                          ? item.insight 
                          : JSON.stringify(item.insight, null, 2)}
                      </Typography>
-                     {item.chart && (
+                     {item.hasChart && (
                        <Box 
                          sx={{ 
                            mt: 1, 
@@ -116,7 +147,7 @@ const PreviousInsights = () => {
                              bgcolor: 'background.paper',
                              '&:hover': { bgcolor: 'background.default' }
                            }}
-                           onClick={() => handleOpenFullscreen(item.chart)}
+                           onClick={() => handleOpenFullscreen(item)}
                          >
                            <FullscreenIcon />
                          </IconButton>
@@ -130,9 +161,22 @@ const PreviousInsights = () => {
            </React.Fragment>
          ))}
        </List>
+       {nextCursor !== null && (
+         <Box sx={{ display: 'flex', justifyContent: 'center', mt: 1 }}>
+           <Button onClick={handleLoadMore} disabled={loadingMore}>
+             {loadingMore ? 'Loading...' : 'Load more'}
+           </Button>
+         </Box>
+       )}
      </Paper>
      {fullscreenChart && (
-       <FullscreenChartDialog chart={fullscreenChart} onClose={handleCloseFullscreen} />
+       <FullscreenChartDialog
+         open
+         handleClose={handleCloseFullscreen}
+         chart={fullscreenChart.map((spec, index) => (
+           <InsightChart key={index} spec={spec} height={500} />
+         ))}
+       />
      )}
    </>
  );
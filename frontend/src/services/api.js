@@ -36,63 +36,196 @@ export const getInsights = async (query) => {
   }
 };
 
-export const fetchDataset = async (datasetName) => {
+const parseSseEvent = (block) => {
+  let event = 'message';
+  const dataLines = [];
+  block.split('\n').forEach((line) => {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).trim());
+    }
+  });
+  return { event, data: dataLines.length > 0 ? JSON.parse(dataLines.join('\n')) : null };
+};
+
+// Streams /query/stream progress; onEvent receives node and token events, the final response is returned
+export const streamInsights = async (query, onEvent) => {
   try {
-    const response = await fetch(`${API_URL}/datasets/${datasetName}`);
+    const token = sessionStorage.getItem('sessionToken');
+    const headers = {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
+    };
+    if (token) {
+      headers['Authorization'] = `Bearer ${token}`;
+    }
+
+    const response = await fetch(`${API_URL}/query/stream`, {
+      method: 'POST',
+      headers: headers,
+      body: JSON.stringify({ query }),
+    });
+
     if (!response.ok) {
-      throw new Error(`Failed to fetch dataset: ${response.statusText}`);
+      const errorData = await response.json();
+      throw new Error(errorData.detail || 'An error occurred while generating insights');
     }
-    const data = await response.json();
-    return data.data;
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      const blocks = buffer.split('\n\n');
+      buffer = blocks.pop();
+      for (const block of blocks) {
+        if (!block.trim()) {
+          continue;
+        }
+        const { event, data } = parseSseEvent(block);
+        if (event === 'final') {
+          if (data.token) {
+            sessionStorage.setItem('sessionToken', data.token);
+          }
+          return data.response;
+        }
+        if (event === 'error') {
+          throw new Error(data.detail || 'An error occurred while generating insights');
+        }
+        if (onEvent) {
+          onEvent(event, data);
+        }
+      }
+    }
+    throw new Error('The insight stream ended before a response was received');
   } catch (error) {
-    console.error('Error fetching dataset:', error);
+    console.error('Error in api streamInsights:', error);
     throw error;
   }
 };
 
-export const fetchInsights = async () => {
-  try {
-    const token = sessionStorage.getItem('sessionToken');
-    const headers = {
-      'Content-Type': 'application/json'
-    };
+const DATASET_PAGE_SIZE = 500;
+
+export const fetchDatasetPage = async (datasetName, { offset = 0, limit = DATASET_PAGE_SIZE, columns } = {}) => {
+  const params = new URLSearchParams({ offset, limit });
+  if (columns && columns.length > 0) {
+    params.set('columns', columns.join(','));
+  }
+  // The server sends an ETag with no-cache, so the browser revalidates and reuses its copy on 304
+  const response = await fetch(`${API_URL}/datasets/${datasetName}?${params}`);
+  if (!response.ok) {
+    throw new Error(`Failed to fetch dataset: ${response.statusText}`);
+  }
+  return response.json();
+};
 
-    if (!token) {
-      throw new Error('No session token found');
+export const fetchDataset = async (datasetName, { columns, onPage } = {}) => {
+  try {
+    let rows = [];
+    let offset = 0;
+    let total = Infinity;
+    while (offset < total) {
+      const page = await fetchDatasetPage(datasetName, { offset, columns });
+      rows = rows.concat(page.data);
+      total = page.total;
+      offset += page.count;
+      if (onPage) {
+        onPage(rows, total);
+      }
+      if (page.count === 0) {
+        break;
+      }
     }
+    return rows;
+  } catch (error) {
+    console.error('Error fetching dataset:', error);
+    throw error;
+  }
+};
 
-    headers['Authorization'] = `Bearer ${token}`;
+const authHeaders = () => {
+  const token = sessionStorage.getItem('sessionToken');
+  if (!token) {
+    throw new Error('No session token found');
+  }
+  return {
+    'Content-Type': 'application/json',
+    'Authorization': `Bearer ${token}`,
+  };
+};
 
-    const response = await fetch(`${API_URL}/insights`, {
+const handleInsightsError = async (response) => {
+  if (response.status === 401) {
+    sessionStorage.removeItem('sessionToken');
+  }
+  const errorData = await response.json();
+  throw new Error(errorData.detail || `Failed to fetch insights: ${response.statusText}`);
+};
+
+// Fetches one page of insight history (newest first); charts are loaded separately via fetchInsight
+export const fetchInsights = async ({ cursor = null, limit = 20 } = {}) => {
+  try {
+    const params = new URLSearchParams({ limit, fields: 'id,original_user_query,date,output' });
+    if (cursor !== null) {
+      params.set('cursor', cursor);
+    }
+    const response = await fetch(`${API_URL}/insights?${params}`, {
       method: 'GET',
-      headers: headers,
+      headers: authHeaders(),
     });
 
     if (!response.ok) {
       if (response.status === 404) {
-        return [];
-      }
-      if (response.status === 401) {
-        sessionStorage.removeItem('sessionToken');
+        return { insights: [], nextCursor: null };
       }
-      const errorData = await response.json();
-      throw new Error(errorData.detail || `Failed to fetch insights: ${response.statusText}`);
+      await handleInsightsError(response);
     }
 
     const data = await response.json();
-    
-    return data.map(insight => {
-      const parsedInsight = typeof insight === 'string' ? JSON.parse(insight) : insight;
-      return {
-        query: parsedInsight.original_user_query,
-        date: parsedInsight.date,
-        insight: parsedInsight.output,
-        chart: parsedInsight.charts
-      };
-    });
+
+    return {
+      insights: data.items.map(insight => ({
+        id: insight.id,
+        query: insight.original_user_query,
+        date: insight.date,
+        insight: insight.output,
+        hasChart: insight.has_charts,
+      })),
+      nextCursor: data.next_cursor,
+    };
 
   } catch (error) {
     console.error('Error fetching insights:', error);
     throw error;
   }
-};
\ No newline at end of file
+};
+
+export const fetchInsight = async (insightId) => {
+  try {
+    const response = await fetch(`${API_URL}/insights/${insightId}`, {
+      method: 'GET',
+      headers: authHeaders(),
+    });
+
+    if (!response.ok) {
+      await handleInsightsError(response);
+    }
+
+    const insight = await response.json();
+    return {
+      id: insight.id,
+      query: insight.original_user_query,
+      date: insight.date,
+      insight: insight.output,
+      chart: insight.charts,
+    };
+  } catch (error) {
+    console.error('Error fetching insight:', error);
+    throw error;
+  }
+};